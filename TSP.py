@@ -7,6 +7,9 @@ import random
 import math
 from statsmodels.tsa.holtwinters import SimpleExpSmoothing
 
+from predictors import OnlineMA, OnlineSES, OnlineLSM_AR, OnlineLSM_SQR
+from lsm_fit import IncrementalFit
+
 
 precalc_dir_name = "./precalc_distance_summation_midv2019/"
 precalc_dir = os.listdir(precalc_dir_name)
@@ -17,10 +20,8 @@ precalc_f = precalc_dir_name + precalc_file
 with open(precalc_f) as js:
     data = json.load(js)
 
-axis_x = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30]
-axis_x_2 = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31]
-#axis_x = np.arange(1, len(data)+1, 1)
-#axis_x_2 = np.arange(2, len(data)+2, 1)
+axis_x = np.arange(1, len(data)+1, 1)
+axis_x_2 = np.arange(2, len(data)+2, 1)
 
 
     
@@ -39,9 +40,10 @@ def MA(time_series, window):
 
 #MA
 final_sample = []
+predictor = OnlineMA(2)
 for i in range(len(data)-1):
-    test = MA(data[0:i+1], 2)
-    final_sample.append(test)
+    predictor.update(data[i])
+    final_sample.append(predictor.predict())
 final_sample.append(MA(data, 2))
 plt.scatter(axis_x, data, label="Data")
 plt.scatter(axis_x_2, final_sample, label = "Predictions MA")
@@ -59,9 +61,10 @@ def SES(time_series, smoothing_coeficient):
 
 #SES
 final_sample = []
+predictor = OnlineSES(0.6)
 for i in range(len(data)-1):
-    test = SES(data[0:i+1], 0.6)
-    final_sample.append(test[-1])
+    predictor.update(data[i])
+    final_sample.append(predictor.predict())
 
 final_sample.append(SES(data, 0.9)[-1])
 
@@ -99,8 +102,10 @@ def LSM_AR(time_series, window):
 
 #LSM_AR
 final_sample = []
+predictor = OnlineLSM_AR(10)
 for i in range(len(data)-1):
-    test = LSM_AR(data[0:i+1], 10)
+    predictor.update(data[i])
+    test = predictor.coefficients()
     final_sample.append(test[0] + axis_x[i+1] * test[1])
 fin_elem = LSM_AR(data, 10)
 final_sample.append(fin_elem[0] + (axis_x[-1]+1) * test[1])
@@ -123,9 +128,10 @@ def LSM_SQR(time_series):
 
 #LSM_SQR
 final_sample = []
+predictor = OnlineLSM_SQR()
 for i in range(len(data)-1):
-    test = LSM_SQR(data[0:i+1])
-    final_sample.append(test * axis_x[i+1] * axis_x[i+1])
+    predictor.update(data[i])
+    final_sample.append(predictor.coefficient() * axis_x[i+1] * axis_x[i+1])
 
 final_sample.append(LSM_SQR(data) * (axis_x[-1]+1 * axis_x[-1]+1))
 
@@ -211,9 +217,10 @@ sample_ = []
 plt.scatter(axis_x, data, label="Data")
 #a = lin_LSE(axis_x, data_, 1)
 #a = LSM_exp(data, 30)
-for i in range(1 , len(axis_x)):
-    sample_.append(LSM_exp(data[0:i], 30))
-sample_.append(LSM_exp(data, 30))
+predictor = IncrementalFit('exp', 30)
+for i in range(len(axis_x)):
+    predictor.update(data[i])
+    sample_.append(predictor.predict())
 plt.scatter(axis_x_2, sample_, label = "fweczshg")
 #print(a)
 #for i in range(len(axis_x)):
@@ -0,0 +1,184 @@
+'''
+Single-file container for the clips of one (dataset, method).
+
+Layout of precalc_<method>_<dataset>.clips:
+
+    8 bytes   magic 'CLIPPACK'
+    8 bytes   little-endian header length
+    header    JSON: dtype, columns, the manifest_digest of each source directory
+              and one [clip_id, precalc_offset, precalc_frames, distance_offset,
+              distance_frames] entry per clip, offsets in bytes from the payload
+              start
+    payload   precalc frames of all clips, then distance frames of all clips,
+              back to back, starting at a 64-byte boundary
+
+The payload is mmap-ed, so a single clip is read without touching the rest
+and each section comes back as a zero-copy RaggedArray.
+
+open_archive compares the digests with the source directories when they are
+present; an archive exported from other contents is reported and skipped.
+'''
+import os, json, mmap, struct, warnings, argparse
+
+import numpy as np
+
+from ragged import RaggedArray
+from precalc_store import ALL_DATASETS, ALL_METHODS, PRECALC_DIRECTORY_PATTERNS, precalc_directory, ensure_cache, \
+                          manifest_digest, load_precalc, load_precalc_distance, load_clip_ids, load_clip_index
+
+ARCHIVE_MAGIC = b'CLIPPACK'
+ARCHIVE_ALIGN = 64
+ARCHIVE_PATTERN = './precalc_%s_%s.clips'
+
+
+def archive_path(dataset, method):
+    return ARCHIVE_PATTERN % (method, dataset)
+
+def export_archive(dataset, method, path=None):
+    '''
+    Packs the joined precalc and distance clips of (dataset, method) into one archive.
+    Only clips present in both directories are packed.
+    '''
+    if path is None:
+        path = archive_path(dataset, method)
+    precalc_dir = precalc_directory(dataset, method, 'precalc')
+    precalc_dist_dir = precalc_directory(dataset, method, 'distance')
+    clip_index = load_clip_index(precalc_dir, precalc_dist_dir)
+    clip_ids = load_clip_ids(precalc_dir)
+    precalc = load_precalc(precalc_dir)[clip_index[0]]
+    precalc_dist = load_precalc_distance(precalc_dist_dir)[clip_index[1]]
+
+    precalc_row_bytes = precalc.values[0:1].nbytes
+    distance_row_bytes = precalc_dist.values.itemsize
+    distance_start = precalc.values.nbytes
+    clips = []
+    for i in range(len(precalc)):
+        clips.append([clip_ids[clip_index[0][i]], \
+                      int(precalc.offsets[i]) * precalc_row_bytes, int(precalc.lengths[i]), \
+                      distance_start + int(precalc_dist.offsets[i]) * distance_row_bytes, int(precalc_dist.lengths[i])])
+    header = json.dumps({
+        'dtype': precalc.dtype.str,
+        'columns': precalc.values.shape[1],
+        'sources': {'precalc': manifest_digest(precalc_dir), 'distance': manifest_digest(precalc_dist_dir)},
+        'clips': clips
+    }).encode('utf-8')
+    header_end = len(ARCHIVE_MAGIC) + 8 + len(header)
+    padding = -header_end % ARCHIVE_ALIGN
+
+    with open(path + '.tmp', 'wb') as f:
+        f.write(ARCHIVE_MAGIC)
+        f.write(struct.pack('<Q', len(header) + padding))
+        f.write(header)
+        f.write(b' ' * padding)
+        f.write(np.ascontiguousarray(precalc.values).tobytes())
+        f.write(np.ascontiguousarray(precalc_dist.values, dtype=precalc.dtype).tobytes())
+    os.replace(path + '.tmp', path)
+    return len(clips)
+
+
+def open_archive(dataset, method):
+    '''
+    ClipArchive of (dataset, method), or None when there is none or when a
+    source directory no longer has the contents it was exported from (with a
+    warning, the directories are read instead)
+    '''
+    path = archive_path(dataset, method)
+    if not os.path.exists(path):
+        return None
+    archive = ClipArchive(path)
+    for kind in PRECALC_DIRECTORY_PATTERNS:
+        precalc_dir = precalc_directory(dataset, method, kind)
+        if not os.path.isdir(precalc_dir):
+            continue
+        ensure_cache(precalc_dir)
+        if archive.sources.get(kind) != manifest_digest(precalc_dir):
+            warnings.warn('%s: %s changed since the archive was exported, reading the directories instead' % \
+                          (path, precalc_dir))
+            archive.close()
+            return None
+    return archive
+
+
+class ClipArchive:
+    '''
+    Read-only view of a .clips file
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            raise ValueError('%s: not a clip archive' % path)
+        header_length = struct.unpack('<Q', self.mm[len(ARCHIVE_MAGIC):len(ARCHIVE_MAGIC) + 8])[0]
+        header_start = len(ARCHIVE_MAGIC) + 8
+        header = json.loads(self.mm[header_start:header_start + header_length].decode('utf-8'))
+        self.payload_start = header_start + header_length
+        self.dtype = np.dtype(header['dtype'])
+        self.columns = header['columns']
+        self.sources = header.get('sources', {})
+        self.clips = header['clips']
+        self.clip_ids = [clip[0] for clip in self.clips]
+        self.positions = {}
+        for i, clip in enumerate(self.clips):
+            self.positions[clip[0]] = i
+
+    def __len__(self):
+        return len(self.clips)
+
+    def section(self, offset, count):
+        return np.frombuffer(self.mm, dtype=self.dtype, count=count, offset=self.payload_start + offset)
+
+    def read_clip(self, clip_id):
+        '''
+        (precalc frames x columns, distances) of a single clip
+        '''
+        return self.read_position(self.positions[clip_id])
+
+    def read_position(self, i):
+        clip_id, precalc_offset, precalc_frames, distance_offset, distance_frames = self.clips[i]
+        precalc = self.section(precalc_offset, precalc_frames * self.columns).reshape(precalc_frames, self.columns)
+        return precalc, self.section(distance_offset, distance_frames)
+
+    def __iter__(self):
+        '''
+        Streams (clip_id, precalc, distances) in archive order
+        '''
+        for i in range(len(self.clips)):
+            precalc, precalc_dist = self.read_position(i)
+            yield self.clips[i][0], precalc, precalc_dist
+
+    def section_offsets(self, frames_column):
+        offsets = np.zeros(len(self.clips) + 1, dtype=np.int64)
+        for i, clip in enumerate(self.clips):
+            offsets[i + 1] = offsets[i] + clip[frames_column]
+        return offsets
+
+    def load_precalc(self):
+        '''
+        RaggedArray view of all precalc records
+        '''
+        offsets = self.section_offsets(2)
+        values = self.section(0, int(offsets[-1]) * self.columns).reshape(-1, self.columns)
+        return RaggedArray(values, offsets)
+
+    def load_precalc_distance(self):
+        '''
+        RaggedArray view of all distance records
+        '''
+        offsets = self.section_offsets(4)
+        start = self.clips[0][3] if self.clips else 0
+        return RaggedArray(self.section(start, int(offsets[-1])), offsets)
+
+    def close(self):
+        self.mm.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack precalc directories into .clips archives')
+    parser.add_argument('--datasets', nargs='+', default=ALL_DATASETS)
+    parser.add_argument('--methods', nargs='+', default=ALL_METHODS)
+    args = parser.parse_args()
+    for dataset in args.datasets:
+        for method in args.methods:
+            count = export_archive(dataset, method)
+            print('%s: %d clips' % (archive_path(dataset, method), count))
@@ -0,0 +1,237 @@
+'''
+Process-wide registry of loaded precalc arrays.
+
+Every collector asks the registry for (dataset, method, kind) instead of
+opening the directory itself, so a figure run loads each directory once.
+Entries are kept in RAM up to a memory cap and evicted least recently used.
+Clip data is held in the registry's storage dtype ('float64' or 'float32').
+When a .clips archive exists for (dataset, method) it is read instead of
+the directories, unless they have changed since it was exported.
+
+iter_clip_blocks streams the same clip table block by block straight from the
+memory-mapped store, for datasets that do not fit in RAM. The store is opened
+and validated once per process and kept in the registry's opened sources.
+'''
+from collections import OrderedDict
+
+import numpy as np
+
+from precalc_store import precalc_directory, open_directory, load_precalc, load_precalc_distance, load_clip_index
+from clip_archive import open_archive
+from ragged import RaggedArray
+
+REGISTRY_MEMORY_LIMIT = 4 * 1024 ** 3
+REGISTRY_DTYPE = 'float64'
+BLOCK_CLIPS = 1024
+ALIGNED_KINDS = {'precalc': 'aligned_precalc', 'distance': 'aligned_distance'}
+
+LOADERS = {
+    'precalc': lambda dataset, method, dtype: \
+        load_precalc(precalc_directory(dataset, method, 'precalc'), dtype=dtype),
+    'distance': lambda dataset, method, dtype: \
+        load_precalc_distance(precalc_directory(dataset, method, 'distance'), dtype=dtype),
+    'clip_index': lambda dataset, method, dtype: \
+        load_clip_index(precalc_directory(dataset, method, 'precalc'), precalc_directory(dataset, method, 'distance'))
+}
+
+ARCHIVE_SECTIONS = {
+    'precalc': lambda archive: archive.load_precalc(),
+    'distance': lambda archive: archive.load_precalc_distance()
+}
+
+ARCHIVE_LOADERS = {
+    'precalc': lambda archive, dtype: archive.load_precalc().astype(dtype),
+    'distance': lambda archive, dtype: archive.load_precalc_distance().astype(dtype),
+    'clip_index': lambda archive, dtype: np.tile(np.arange(len(archive), dtype=np.intp), (2, 1))
+}
+
+def load_kind(dataset, method, kind, dtype='float64'):
+    archive = get_archive(dataset, method)
+    if archive is not None:
+        return ARCHIVE_LOADERS[kind](archive, dtype)
+    return LOADERS[kind](dataset, method, dtype)
+
+def in_memory(values):
+    '''
+    Read-only in-RAM copy of a loaded array or RaggedArray
+    '''
+    if isinstance(values, RaggedArray):
+        values = values.copy()
+        values.values.flags.writeable = False
+        values.offsets.flags.writeable = False
+    else:
+        values = np.array(values)
+        values.flags.writeable = False
+    return values
+
+
+class DatasetRegistry:
+    def __init__(self, memory_limit=REGISTRY_MEMORY_LIMIT, dtype=REGISTRY_DTYPE):
+        self.memory_limit = memory_limit
+        self.dtype = dtype
+        self.entries = OrderedDict()
+        self.pinned = {}
+        self.opened = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, dataset, method, kind):
+        '''
+        Read-only array (RaggedArray for clip data) for (dataset, method, kind),
+        loaded on first request
+        '''
+        return self.get_built((dataset, method, kind, self.dtype), \
+                              lambda: in_memory(load_kind(dataset, method, kind, self.dtype)))
+
+    def get_built(self, key, build):
+        '''
+        Entry for key, build() makes it on first request (for arrays derived
+        from loaded ones, cached under the same memory cap)
+        '''
+        if key in self.pinned:
+            self.hits += 1
+            return self.pinned[key]
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        values = build()
+        self.put(key, values)
+        return values
+
+    def put(self, key, values):
+        if values.nbytes > self.memory_limit:
+            return
+        while self.entries and self.nbytes + values.nbytes > self.memory_limit:
+            self.evict()
+        self.entries[key] = values
+        self.nbytes += values.nbytes
+
+    def pin(self, key, values):
+        '''
+        Serves values for key from now on, outside the memory cap and never
+        evicted (arrays owned elsewhere, e.g. shared memory)
+        '''
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key).nbytes
+        self.pinned[key] = values
+
+    def get_opened(self, key, open_source):
+        '''
+        Memory-mapped source for key, open_source() opens and validates it on
+        first request. Sources are file-backed, kept outside the memory cap.
+        '''
+        if key in self.opened:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.opened[key] = open_source()
+        return self.opened[key]
+
+    def evict(self):
+        key, values = self.entries.popitem(last=False)
+        self.nbytes -= values.nbytes
+        self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.pinned.clear()
+        self.opened.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'pinned': len(self.pinned),
+            'opened': len(self.opened),
+            'nbytes': self.nbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+REGISTRY = DatasetRegistry()
+
+def get_precalc(dataset, method):
+    return REGISTRY.get(dataset, method, 'precalc')
+
+def get_precalc_distance(dataset, method):
+    return REGISTRY.get(dataset, method, 'distance')
+
+def get_aligned(dataset, method, kind, rows):
+    '''
+    Clips rows of the kind table, cached in the registry as 'aligned_' + kind
+    unless rows already are the table order
+    '''
+    table = REGISTRY.get(dataset, method, kind)
+    if len(rows) == len(table) and np.array_equal(rows, np.arange(len(table))):
+        return table
+    return REGISTRY.get_built((dataset, method, ALIGNED_KINDS[kind], REGISTRY.dtype), \
+                              lambda: in_memory(table[rows]))
+
+def get_clip_table(dataset, method):
+    '''
+    Precalc and distance RaggedArrays with clips aligned by clip id
+    '''
+    clip_index = REGISTRY.get(dataset, method, 'clip_index')
+    return get_aligned(dataset, method, 'precalc', clip_index[0]), \
+           get_aligned(dataset, method, 'distance', clip_index[1])
+
+def get_archive(dataset, method):
+    '''
+    open_archive of (dataset, method), opened and checked once per process
+    '''
+    return REGISTRY.get_opened((dataset, method, 'archive'), lambda: open_archive(dataset, method))
+
+def get_source(dataset, method, kind):
+    '''
+    Memory-mapped (values, [start, length] spans) of the kind clips in table
+    order, from the archive or the directory cache
+    '''
+    def open_source():
+        archive = get_archive(dataset, method)
+        if archive is None:
+            return open_directory(precalc_directory(dataset, method, kind), dtype=REGISTRY.dtype)
+        ragged = ARCHIVE_SECTIONS[kind](archive)
+        return ragged.values, np.stack([ragged.offsets[:-1], ragged.lengths], axis=1)
+    return REGISTRY.get_opened((dataset, method, kind, REGISTRY.dtype), open_source)
+
+def block_reader(dataset, method, kind, rows):
+    '''
+    read(start, stop) of the clips rows[start:stop] of the kind table: sliced
+    from the registry's pinned copy when one is shared with this process,
+    else gathered from the memory-mapped source
+    '''
+    aligned = REGISTRY.pinned.get((dataset, method, ALIGNED_KINDS[kind], REGISTRY.dtype))
+    if aligned is not None:
+        return lambda start, stop: aligned[start:stop]
+    table = REGISTRY.pinned.get((dataset, method, kind, REGISTRY.dtype))
+    if table is not None:
+        return lambda start, stop: table.take(rows[start:stop])
+    values, spans = get_source(dataset, method, kind)
+
+    def read(start, stop):
+        block = RaggedArray.from_spans(values, spans[rows[start:stop]])
+        return block if block.dtype == REGISTRY.dtype else block.astype(REGISTRY.dtype)
+    return read
+
+def iter_clip_blocks(dataset, method, block_clips=BLOCK_CLIPS):
+    '''
+    Streams the clip table of get_clip_table as aligned (precalc, distance)
+    RaggedArray blocks of at most block_clips clips. Only the clip index goes
+    through the registry, a block is gathered from the mmap-ed values when it
+    is reached, so peak memory does not depend on the number of clips.
+    Tables shared by SharedClipTables are sliced in place instead.
+    '''
+    clip_index = REGISTRY.get(dataset, method, 'clip_index')
+    precalc = block_reader(dataset, method, 'precalc', clip_index[0])
+    precalc_dist = block_reader(dataset, method, 'distance', clip_index[1])
+    for start in range(0, clip_index.shape[1], block_clips):
+        yield precalc(start, start + block_clips), precalc_dist(start, start + block_clips)
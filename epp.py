@@ -0,0 +1,428 @@
+'''
+Expected performance profiles (EPP) and ROC curves of stopping rules.
+
+A stopping rule is given by a per-frame score RaggedArray: a clip stops at
+the first frame whose score is at or below the threshold. errors is the
+matching RaggedArray of per-frame error levels (precalc column 0); as in the
+list collectors, its clip lengths decide how many frames a clip has.
+'''
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from precalc_store import ERROR_COLUMN, ESTIMATION_COLUMN
+from prediction_cache import cached_predictions
+
+SMALL_DELTA = 0.1
+
+DATAPOINTS_COUNT = 300
+MIN_THRESHOLD = -0.001
+MAX_THRESHOLD = 0.15
+EXACT_THRESHOLDS = 'exact'
+
+
+def default_thresholds():
+    return [MIN_THRESHOLD + (MAX_THRESHOLD - MIN_THRESHOLD) * i / (DATAPOINTS_COUNT - 1) \
+            for i in range(DATAPOINTS_COUNT)]
+
+def clip_errors(precalc):
+    return precalc.column(ERROR_COLUMN)
+
+def modelling_scores(precalc):
+    '''
+    Next combination result modelling score (SMALL_DELTA + estimation) / (frame + 2)
+    '''
+    estimation = precalc.values[:, ESTIMATION_COLUMN]
+    return precalc.with_values((SMALL_DELTA + estimation) / (precalc.frame_index() + 2))
+
+def unpad(ragged, padded):
+    '''
+    RaggedArray with the layout of ragged over the clips x frames padded values
+    '''
+    return ragged.with_values(padded[ragged.clip_of_frame(), ragged.frame_index()])
+
+def stopper_scores(precalc_dist, model, *args, clip_start=1):
+    '''
+    Scores of the *_stopper_epp loops: the forecast of model from distances
+    clip_start..i-1 at frame i > clip_start, from the clip_start distance
+    alone at frame clip_start. Earlier frames never stop.
+    '''
+    distances = precalc_dist.to_padded(np.nan)
+    scores = np.full(distances.shape, np.nan)
+    if distances.shape[1] > clip_start:
+        predictions = cached_predictions(distances[:, clip_start:], model, *args)
+        scores[:, clip_start] = predictions[:, 0]
+        scores[:, clip_start + 1:] = predictions[:, :-1]
+    return unpad(precalc_dist, scores)
+
+def lagged_scores(precalc_dist, model, *args):
+    '''
+    Scores of the roc_curve_* loops: the forecast of model from distances
+    0..j-1 at frame j > 0, the first distance itself at frame 0
+    '''
+    distances = precalc_dist.to_padded(np.nan)
+    scores = np.array(distances, dtype=np.float64)
+    if distances.shape[1] > 1:
+        scores[:, 1:] = cached_predictions(distances, model, *args)[:, :-1]
+    return unpad(precalc_dist, scores)
+
+def next_scores(precalc_dist, model, *args, clip_start=1):
+    '''
+    Scores of roc_curve_LSM_exp_stoppers: the forecast of the next distance by
+    model from distances clip_start..j at frame j >= clip_start, the
+    distance itself at earlier frames
+    '''
+    distances = precalc_dist.to_padded(np.nan)
+    scores = np.array(distances, dtype=np.float64)
+    if distances.shape[1] > clip_start:
+        scores[:, clip_start:] = cached_predictions(distances[:, clip_start:], model, *args)
+    return unpad(precalc_dist, scores)
+
+def fixed_scores(ragged):
+    '''
+    1 / (frame + 1): stops after a fixed number of frames, the same for every clip
+    '''
+    return ragged.with_values(1.0 / (ragged.frame_index() + 1))
+
+def consecutive_scores(precalc_dist, k, clip_start=0):
+    '''
+    Scores of the k-in-a-row stopper: the largest of distances j - k + 1..j
+    at frame j, at or below a threshold exactly when the last k distances
+    all are. Frames whose window reaches before clip_start never stop.
+    '''
+    distances = precalc_dist.to_padded(np.nan)
+    scores = np.full(distances.shape, np.inf)
+    if distances.shape[1] >= clip_start + k:
+        scores[:, clip_start + k - 1:] = sliding_window_view(distances[:, clip_start:], k, axis=1).max(axis=-1)
+    return unpad(precalc_dist, scores)
+
+def ses_scores(precalc_dist, smoothing_coeficient):
+    '''
+    Distance predicted by SES as exp_smth_stopper_epp scores it with clip_start
+    1: SES of the first i distances at frame i >= 2, the distance itself at frame 1
+    '''
+    scores = lagged_scores(precalc_dist, 'SES', smoothing_coeficient)
+    second = precalc_dist.offsets[:-1][precalc_dist.lengths > 1] + 1
+    scores.values[second] = precalc_dist.values[second]
+    return scores
+
+def frame_scores(scores, lengths, frames):
+    '''
+    clips x frames scores with +inf past the end of every clip
+    '''
+    padded_scores = scores.to_padded(np.inf, frames)
+    padded_scores[np.arange(frames) >= lengths[:, None]] = np.inf
+    return padded_scores
+
+def prefix_records(padded_scores):
+    '''
+    (clip, frame) of the frames whose score is below all earlier scores of
+    the clip, in clip then frame order. NaN and +inf scores never are.
+    '''
+    scores = np.where(np.isnan(padded_scores), np.inf, padded_scores)
+    previous_min = np.full(scores.shape, np.inf)
+    previous_min[:, 1:] = np.minimum.accumulate(scores, axis=1)[:, :-1]
+    return np.nonzero(scores < previous_min)
+
+def record_steps(padded_scores, values, fallback):
+    '''
+    (record scores, value steps, fallback sum) of values (clips x frames x k)
+    at the stopping frame, the first frame whose score is at or below the
+    threshold, or of fallback (clips x k) for a clip that does not stop.
+    Once the threshold drops below a record's score, the record's clip stops
+    at its next record instead, or at the fallback after its last one.
+    '''
+    clip, frame = prefix_records(padded_scores)
+    record_values = values[clip, frame]
+    last = np.ones(len(clip), dtype=bool)
+    last[:-1] = clip[1:] != clip[:-1]
+    next_values = np.empty_like(record_values)
+    next_values[:-1] = record_values[1:]
+    next_values[last] = fallback[clip[last]]
+    return padded_scores[clip, frame], record_values - next_values, fallback.sum(axis=0)
+
+def merge_steps(parts):
+    '''
+    record_steps of the clips of all parts together
+    '''
+    record_scores, value_steps, fallback_sums = zip(*parts)
+    return np.concatenate(record_scores), np.concatenate(value_steps), np.sum(fallback_sums, axis=0)
+
+def sweep_sums(steps, thresholds):
+    '''
+    thresholds x k sums of record_steps. A clip's stop only moves at the
+    records of its running minimum, so one sort of the record scores answers
+    every threshold: the sum at a threshold is the fallback sum plus the
+    value steps of all records at or below it, found with searchsorted.
+    O(N log N) for N frames, for any number of thresholds.
+    '''
+    record_scores, value_steps, fallback_sum = steps
+    order = np.argsort(record_scores, kind='stable')
+    sums = np.zeros((len(order) + 1,) + value_steps.shape[1:])
+    np.cumsum(value_steps[order], axis=0, out=sums[1:])
+    return fallback_sum + sums[np.searchsorted(record_scores[order], thresholds, side='right')]
+
+def stop_steps(scores, errors, early_scores=None):
+    '''
+    record_steps of the frame count and error level of the *_stopper_epp
+    rule, for thresholds up to 1.0 (the first frame never stops) and above.
+    early_scores replace scores above 1.0, for a score that depends on the
+    first frame allowed to stop.
+    '''
+    padded_errors = errors.to_padded(np.nan)
+    padded_scores = frame_scores(scores, errors.lengths, padded_errors.shape[1])
+    padded_early_scores = padded_scores if early_scores is None else \
+                          frame_scores(early_scores, errors.lengths, padded_errors.shape[1])
+    lengths = errors.lengths
+
+    frames = np.broadcast_to(np.arange(1, padded_errors.shape[1] + 1, dtype=np.float64), padded_errors.shape)
+    values = np.stack([frames, padded_errors], axis=-1)
+    fallback = np.stack([lengths, padded_errors[np.arange(len(lengths)), lengths - 1]], axis=-1)
+    return record_steps(padded_scores[:, 1:], values[:, 1:], fallback), record_steps(padded_early_scores, values, fallback)
+
+def stop_sums(steps, thresholds):
+    late_steps, early_steps = steps
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    sums = np.empty((len(thresholds), 2))
+    late = thresholds <= 1.0
+    sums[late] = sweep_sums(late_steps, thresholds[late])
+    sums[~late] = sweep_sums(early_steps, thresholds[~late])
+    return sums[:, 0], sums[:, 1]
+
+def threshold_sums(scores, errors, thresholds, early_scores=None):
+    '''
+    Sums over clips of the stopping frame count and the error level at every
+    threshold. The first frame may only stop for thresholds above 1.0; a clip
+    that never stops is charged all its frames and its last error.
+    '''
+    return stop_sums(stop_steps(scores, errors, early_scores), thresholds)
+
+def exact_thresholds(steps):
+    '''
+    Every threshold where the sums of stop_steps may change: -inf (no clip
+    stops), the record scores up to 1.0, the first threshold above 1.0 and
+    the record scores above it. The sums hold from each one up to the next.
+    '''
+    late_scores, early_scores = steps[0][0], steps[1][0]
+    return np.unique(np.concatenate([[-np.inf], late_scores[late_scores <= 1.0], \
+                                     [np.nextafter(1.0, np.inf)], early_scores[early_scores > 1.0]]))
+
+def exact_sums(steps):
+    '''
+    (thresholds, frame count sums, error level sums) at the exact thresholds
+    where the sums change, the whole piecewise constant curve
+    '''
+    thresholds = exact_thresholds(steps)
+    sum_clip_length, sum_error_level = stop_sums(steps, thresholds)
+    changed = np.ones(len(thresholds), dtype=bool)
+    changed[1:] = (np.diff(sum_clip_length) != 0) | (np.diff(sum_error_level) != 0)
+    return thresholds[changed], sum_clip_length[changed], sum_error_level[changed]
+
+def exact_epp(scores, errors, early_scores=None):
+    '''
+    Thresholds, mean number of frames and mean error level of every step of
+    the EPP curve: the curve at any threshold is the point of the last
+    threshold at or below it
+    '''
+    thresholds, sum_clip_length, sum_error_level = exact_sums(stop_steps(scores, errors, early_scores))
+    return thresholds.tolist(), (sum_clip_length / len(scores)).tolist(), (sum_error_level / len(scores)).tolist()
+
+def threshold_epp(scores, errors, thresholds=None, early_scores=None):
+    '''
+    Mean number of frames and mean error level at every threshold, as the
+    *_stopper_epp collectors compute them. thresholds=EXACT_THRESHOLDS gives
+    the points of exact_epp instead.
+    '''
+    if isinstance(thresholds, str) and thresholds == EXACT_THRESHOLDS:
+        return exact_epp(scores, errors, early_scores)[1:]
+    if thresholds is None:
+        thresholds = default_thresholds()
+    sum_clip_length, sum_error_level = threshold_sums(scores, errors, thresholds, early_scores)
+    return (sum_clip_length / len(scores)).tolist(), (sum_error_level / len(scores)).tolist()
+
+def chunked_threshold_epp(blocks, score, thresholds=None, early_score=None):
+    '''
+    threshold_epp over a stream of (precalc, precalc_dist) blocks, score (and
+    early_score) map a block to its per-frame scores. Only the per-threshold
+    sums are kept, or the record steps of every block for EXACT_THRESHOLDS.
+    '''
+    def block_scores(precalc, precalc_dist):
+        early_scores = None if early_score is None else early_score(precalc, precalc_dist)
+        return score(precalc, precalc_dist), clip_errors(precalc), early_scores
+
+    if isinstance(thresholds, str) and thresholds == EXACT_THRESHOLDS:
+        parts = []
+        count = 0
+        for precalc, precalc_dist in blocks:
+            parts.append(stop_steps(*block_scores(precalc, precalc_dist)))
+            count += len(precalc)
+        steps = [merge_steps(regime) for regime in zip(*parts)]
+        sum_clip_length, sum_error_level = exact_sums(steps)[1:]
+        return (sum_clip_length / count).tolist(), (sum_error_level / count).tolist()
+    if thresholds is None:
+        thresholds = default_thresholds()
+    sum_clip_length = np.zeros(len(thresholds))
+    sum_error_level = np.zeros(len(thresholds))
+    count = 0
+    for precalc, precalc_dist in blocks:
+        scores, errors, early_scores = block_scores(precalc, precalc_dist)
+        block_length, block_error = threshold_sums(scores, errors, thresholds, early_scores)
+        sum_clip_length += block_length
+        sum_error_level += block_error
+        count += len(precalc)
+    return (sum_clip_length / count).tolist(), (sum_error_level / count).tolist()
+
+def chunked_stopper_epp(blocks, model, *args, thresholds=None):
+    '''
+    chunked_threshold_epp of the *_stopper_epp loop of a forecasting model:
+    forecasts from clip_start 1 for thresholds up to 1.0, from the first
+    distance above it
+    '''
+    return chunked_threshold_epp(blocks, lambda precalc, precalc_dist: stopper_scores(precalc_dist, model, *args), thresholds, \
+                                 lambda precalc, precalc_dist: stopper_scores(precalc_dist, model, *args, clip_start=0))
+
+ROC_CANDIDATE = np.dtype([('score', np.float64), ('frame_step', np.int64), ('error_step', np.float64)])
+
+def roc_candidates(scores, errors, clip_start=0, last=False):
+    '''
+    Candidate stops of the ROC curve as a ROC_CANDIDATE array, plus the
+    frame count and error sums of the starting stops. Every clip starts
+    stopped at frame clip_start (its last frame when shorter), which is its
+    first candidate; later candidates are the frames whose score beats all
+    earlier candidates of the clip. With last, a clip without later
+    candidates gets its last frame as one. Steps are relative to the
+    previous candidate of the same clip, a frame j stop counts j + 1 frames.
+    '''
+    padded_errors = errors.to_padded(np.nan)
+    lengths = errors.lengths
+    padded_scores = frame_scores(scores, lengths, padded_errors.shape[1])
+    padded_scores[np.isnan(padded_scores)] = np.inf
+    start = np.minimum(clip_start, lengths - 1)
+    frame_index = np.arange(padded_scores.shape[1])
+
+    previous_min = np.full(padded_scores.shape, np.inf)
+    previous_min[:, 1:] = np.minimum.accumulate(np.where(frame_index < start[:, None], np.inf, padded_scores), axis=1)[:, :-1]
+    candidate = (padded_scores < previous_min) & (frame_index > start[:, None])
+    if last:
+        alone = ~candidate.any(axis=1) & (lengths - 1 > start)
+        candidate[alone, lengths[alone] - 1] = True
+    candidate[np.arange(len(lengths)), start] = True
+    clip, frame = np.nonzero(candidate)
+
+    error = padded_errors[clip, frame]
+    first = np.ones(len(clip), dtype=bool)
+    first[1:] = clip[1:] != clip[:-1]
+    candidates = np.empty(len(clip), dtype=ROC_CANDIDATE)
+    candidates['score'] = padded_scores[clip, frame]
+    candidates['frame_step'] = np.where(first, 0, frame - np.roll(frame, 1))
+    candidates['error_step'] = np.where(first, 0.0, error - np.roll(error, 1))
+    return candidates, float((start + 1).sum()), float(padded_errors[np.arange(len(lengths)), start].sum())
+
+def roc_curve(candidates, start_frames, start_error, count):
+    '''
+    Curve of roc_candidates taken in order of decreasing score (the earlier
+    candidate first on ties), one point per candidate after the starting one
+    '''
+    taken = candidates[np.argsort(-candidates['score'], kind='stable')]
+    x = (np.concatenate([[0], np.cumsum(taken['frame_step'])]) + start_frames) / count
+    y = (np.concatenate([[0.0], np.cumsum(taken['error_step'])]) + start_error) / count
+    return x.tolist(), y.tolist()
+
+def greedy_roc(scores, errors, clip_start=0, last=False):
+    '''
+    ROC curve of a score: every clip starts stopped at its first frame, then
+    the candidate stops are taken in order of decreasing score, one point
+    per candidate
+    '''
+    return roc_curve(*roc_candidates(scores, errors, clip_start, last), len(scores))
+
+def chunked_greedy_roc(blocks, score, clip_start=0, last=False):
+    '''
+    greedy_roc over a stream of (precalc, precalc_dist) blocks, only the
+    candidate stops of every block are kept
+    '''
+    parts = []
+    start_frames = 0.0
+    start_error = 0.0
+    count = 0
+    for precalc, precalc_dist in blocks:
+        candidates, block_frames, block_error = roc_candidates(score(precalc, precalc_dist), clip_errors(precalc), clip_start, last)
+        parts.append(candidates)
+        start_frames += block_frames
+        start_error += block_error
+        count += len(precalc)
+    candidates = np.concatenate(parts) if parts else np.empty(0, dtype=ROC_CANDIDATE)
+    return roc_curve(candidates, start_frames, start_error, count)
+
+def lower_hull(clip_errors):
+    '''
+    Frames of the lower convex hull of the points (j + 1, clip_errors[j]),
+    from the first frame to the first frame of least error (Andrew's
+    monotone chain)
+    '''
+    hull = []
+    for j in range(int(np.argmin(clip_errors)) + 1):
+        while len(hull) > 1 and (clip_errors[hull[-1]] - clip_errors[hull[-2]]) * (j - hull[-2]) >= \
+                                (clip_errors[j] - clip_errors[hull[-2]]) * (hull[-1] - hull[-2]):
+            hull.pop()
+        hull.append(j)
+    return hull
+
+def hull_steps(errors):
+    '''
+    (frame steps, error steps) along the lower hulls of all clips, plus the
+    error sum of all first frames. The steps of a clip have increasing slope.
+    '''
+    frame_steps = []
+    error_steps = []
+    for clip_errors in errors:
+        hull = np.array(lower_hull(clip_errors))
+        frame_steps.append(np.diff(hull))
+        error_steps.append(np.diff(clip_errors[hull]))
+    return np.concatenate(frame_steps or [np.zeros(0, dtype=np.int64)]), \
+           np.concatenate(error_steps or [np.zeros(0)]), float(errors.values[errors.offsets[:-1]].sum())
+
+def hull_frontier(frame_steps, error_steps, start_error, count):
+    '''
+    Sum of the clip hulls: the steps merged in order of increasing slope
+    (largest error drop per frame first) from all clips at their first frame
+    '''
+    order = np.argsort(error_steps / frame_steps, kind='stable')
+    x = (np.concatenate([[0], np.cumsum(frame_steps[order])]) + count) / count
+    y = (np.concatenate([[0.0], np.cumsum(error_steps[order])]) + start_error) / count
+    return x.tolist(), y.tolist()
+
+def oracle_frontier(errors):
+    '''
+    Lower bound of every ROC curve over the per-frame errors: the least mean
+    error at each mean number of frames of a stop chosen per clip with its
+    whole error trajectory known. Each clip stops on the lower convex hull of
+    its (frames, error) points, and the best trade-off spends frames on the
+    steepest hull step of any clip first, so the frontier is the hull steps
+    of all clips sorted by slope, O(N log N).
+    '''
+    return hull_frontier(*hull_steps(errors), len(errors))
+
+def chunked_oracle_frontier(blocks):
+    '''
+    oracle_frontier over a stream of (precalc, precalc_dist) blocks, only
+    the hull steps of every block are kept
+    '''
+    parts = []
+    start_error = 0.0
+    count = 0
+    for precalc, precalc_dist in blocks:
+        frame_steps, error_steps, block_error = hull_steps(clip_errors(precalc))
+        parts.append((frame_steps, error_steps))
+        start_error += block_error
+        count += len(precalc)
+    frame_steps, error_steps = [np.concatenate(part) for part in zip(*parts)] if parts else [np.zeros(0)] * 2
+    return hull_frontier(frame_steps, error_steps, start_error, count)
+
+def frontier_gap(curve, frontier):
+    '''
+    Mean error of every point of curve above the frontier at the same mean
+    number of frames (the frontier is linear between its points and flat
+    after the last one)
+    '''
+    x, y = np.asarray(curve[0]), np.asarray(curve[1])
+    return (y - np.interp(x, frontier[0], frontier[1])).tolist()
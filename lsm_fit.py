@@ -0,0 +1,440 @@
+'''
+Batched least squares fits of the nonlinear LSM_exp and LSM_hprbl models.
+
+The models are y = k * e^(b x) + c and y = k / (x + b) + c over x = 1..n.
+For a fixed b, k and c are the linear least squares solution (lin_LSE,
+lin_LSE_h), so only b is searched over [-10, 10] as trenar_search_exp does,
+with the golden section search of minimizers.py by default. Here the search
+runs for many series at once: every row keeps its own bracket and the probes
+of an iteration are evaluated as whole-array operations.
+
+1 / (x + b) has a pole at b = -x. Instead of letting the search wander
+across poles, the hyperbola is only searched where the pole lies outside
+the observed frames and the forecast frame (hprbl_brackets).
+
+The coarse stage of every search is a lookup in a BasisTable: the basis of
+a grid of rates and its prefix sums, computed once and cached, give F at
+every grid rate from one matrix product. Only the refinement between the
+neighbours of the best grid rate computes fresh basis values. As the grid
+covers the whole bracket, it also picks the best of several local minima
+where the bracket search would settle in whichever it narrows into.
+
+IncrementalFit is the streaming version for one series fed frame by frame:
+it refines the previous rate instead of searching the whole bracket again.
+'''
+import math
+from collections import deque
+
+import numpy as np
+
+from minimizers import SEARCH_EPS, SEARCH_METHOD, MINIMIZERS, BATCH_MINIMIZERS, CountingObjective, brent_search, secant_search
+
+SEARCH_BRACKET = (-10.0, 10.0)
+TIE_TOLERANCE = 1e-12
+SINGULAR_MARGIN = 1e-3
+WARM_WIDTH = 0.25
+EDGE_EPS = 1e-5
+GRID_STEP = 0.1
+TABLE_FRAMES = 32
+CONSTANT_BASIS = 1e-10
+
+
+def exp_basis(coef, x):
+    '''
+    e^(b (x - exp_shift)) for every coef of x = 1..n, at most 1
+    '''
+    return exp_values(np.asarray(coef)[..., None], x, x[-1])
+
+def hprbl_basis(coef, x):
+    return 1 / np.add.outer(coef, x)
+
+def exp_brackets(n, bracket=SEARCH_BRACKET):
+    return [bracket]
+
+def hprbl_brackets(n, bracket=SEARCH_BRACKET):
+    '''
+    Parts of bracket where 1 / (x + b) has no pole for x = 1..n + 1: the pole
+    left of the first frame, or, while the bracket reaches that far, at least
+    one frame past the forecast frame (closer ones explode the forecast)
+    '''
+    brackets = []
+    if bracket[1] > -1 + SINGULAR_MARGIN:
+        brackets.append((max(bracket[0], -1 + SINGULAR_MARGIN), bracket[1]))
+    if bracket[0] < -(n + 2):
+        brackets.append((bracket[0], min(bracket[1], -(n + 2))))
+    return brackets
+
+def degenerate_basis(det, n, sum_x2):
+    '''
+    Rows whose basis is numerically constant (one frame, b = 0, or overflow):
+    k is not determined and only c is fitted
+    '''
+    return ~(det > CONSTANT_BASIS * n * sum_x2)
+
+def linear_fit(basis, y):
+    '''
+    lin_LSE for every row: k and c of the least squares fit k * basis + c, and
+    whether the fit is degenerate (k = 0, c the mean)
+    '''
+    n = basis.shape[1]
+    sum_x = basis.sum(axis=1)
+    sum_x2 = (basis * basis).sum(axis=1)
+    sum_y = y.sum(axis=1)
+    sum_xy = (basis * y).sum(axis=1)
+    det = sum_x2 * n - sum_x * sum_x
+    degenerate = degenerate_basis(det, n, sum_x2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = np.where(degenerate, 0.0, (sum_xy * n - sum_x * sum_y) / det)
+        c = np.where(degenerate, sum_y / n, (sum_x2 * sum_y - sum_xy * sum_x) / det)
+    return k, c, degenerate
+
+def objective(basis_function, coef, x, y):
+    '''
+    Residual sum of squares (F) of the best fit at every row's coef, +inf where
+    it is not finite
+    '''
+    with np.errstate(over='ignore', invalid='ignore'):
+        basis = basis_function(coef, x)
+        k, c, degenerate = linear_fit(basis, y)
+        res = ((k[:, None] * basis + c[:, None] - y) ** 2).sum(axis=1)
+    return np.where(np.isfinite(res), res, np.inf)
+
+def batch_search(basis_function, x, y, left, right, eps=SEARCH_EPS, method=SEARCH_METHOD, counter=None):
+    '''
+    trenar_search_exp for every row of y at once with a batch minimizer of
+    minimizers.py, every row keeps its own bracket. Returns coef, k, c and the
+    degenerate flag per row.
+    '''
+    left = np.broadcast_to(np.asarray(left, dtype=np.float64), (len(y),)).copy()
+    right = np.broadcast_to(np.asarray(right, dtype=np.float64), (len(y),)).copy()
+    f = lambda coef, rows: objective(basis_function, coef, x, y[rows])
+    if counter is not None:
+        counter.f = f
+        f = counter
+    # residuals this close are rounding noise (e.g. two points fit exactly at
+    # any rate), ties go to the left so that exact fits take the fastest decay
+    tie = TIE_TOLERANCE * (y * y).sum(axis=1)
+    coef = BATCH_MINIMIZERS[method](f, left, right, eps, tie)
+    with np.errstate(over='ignore', invalid='ignore'):
+        return (coef,) + linear_fit(basis_function(coef, x), y)
+
+def prefix_fit(distances, basis_function, brackets, eps=SEARCH_EPS, method=SEARCH_METHOD, counter=None, values_function=None):
+    '''
+    (coef, k, c, degenerate) clips x frames matrices of the fits to every
+    prefix of every clip of a clips x frames (NaN padded) matrix, column
+    n - 1 is the fit of the first n values. Degenerate fits (see linear_fit)
+    are flagged instead of leaving inf or NaN. All clips long enough for a prefix length are
+    searched together, in every bracket of brackets(n), keeping the best.
+    With values_function, every bracket is first narrowed per clip to the
+    grid neighbours of the best rate of its basis_table, and only that is
+    searched. counter (a minimizers.CountingObjective) counts the objective
+    evaluations.
+    '''
+    distances = np.asarray(distances, dtype=np.float64)
+    if values_function is not None:
+        table = basis_table(values_function, distances.shape[1])
+    coef = np.full(distances.shape, np.nan)
+    k = np.full(distances.shape, np.nan)
+    c = np.full(distances.shape, np.nan)
+    degenerate = np.zeros(distances.shape, dtype=bool)
+    for n in range(1, distances.shape[1] + 1):
+        rows = np.nonzero(~np.isnan(distances[:, n - 1]))[0]
+        if not len(rows):
+            continue
+        y = distances[rows, :n]
+        x = np.arange(1, n + 1, dtype=np.float64)
+        if n == 1:
+            coef[rows, 0], k[rows, 0], c[rows, 0], degenerate[rows, 0] = 0.0, 0.0, y[:, 0], True
+            continue
+        tie = TIE_TOLERANCE * (y * y).sum(axis=1)
+        best = np.full(len(rows), np.inf)
+        for left, right in brackets(n):
+            if values_function is not None:
+                left, right = table.brackets(y, left, right, tie)
+            fit = batch_search(basis_function, x, y, left, right, eps, method, counter)
+            f = objective(basis_function, fit[0], x, y)
+            better = f < best - tie
+            best = np.where(better, f, best)
+            for result, value in zip((coef, k, c, degenerate), fit):
+                result[rows[better], n - 1] = value[better]
+    return coef, k, c, degenerate
+
+def exp_shift(coef, n):
+    '''
+    The largest frame of e^(b x) over x = 1..n: the last one for growth, the
+    first one for decay
+    '''
+    return np.where(coef > 0, n, 1)
+
+def exp_values(coef, x, n):
+    '''
+    e^(b (x - exp_shift)), the exp basis of a prefix of n frames rescaled to
+    at most 1 over the prefix (k absorbs the scale, F does not change)
+    '''
+    return np.exp(coef * (x - exp_shift(coef, n)))
+
+def hprbl_values(coef, x, n):
+    return 1 / (coef + x)
+
+def exp_slopes(coef, x, values, n):
+    '''
+    d/db of exp_values, from the values
+    '''
+    return (x - exp_shift(coef, n)) * values
+
+def hprbl_slopes(coef, x, values, n):
+    return -values * values
+
+def forecast(values, coef, k, c, x, n):
+    '''
+    k * values(coef, x, n) + c, elementwise
+    '''
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        return k * values(coef, x, n) + c
+
+FIT_MODELS = {
+    'exp': (exp_basis, exp_brackets, exp_values, exp_slopes),
+    'hprbl': (hprbl_basis, hprbl_brackets, hprbl_values, hprbl_slopes)
+}
+
+class BasisTable:
+    '''
+    values_function(b, x) on a grid of b over bracket for x = 1..frames, with
+    prefix sums of the values and of their squares along x: the basis sums
+    of a prefix of n frames at every grid rate are a column lookup, and only
+    sum(y * basis) is left, one matrix product for all rates and rows.
+    '''
+    def __init__(self, values_function, frames, bracket=SEARCH_BRACKET, step=GRID_STEP):
+        self.coefs = np.linspace(bracket[0], bracket[1], int(round((bracket[1] - bracket[0]) / step)) + 1)
+        self.frames = frames
+        with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+            self.values = self.grid_values(values_function)
+            self.sums = np.cumsum(self.values, axis=1)
+            self.square_sums = np.cumsum(self.values * self.values, axis=1)
+
+    def grid_values(self, values_function):
+        return values_function(self.coefs[:, None], np.arange(1, self.frames + 1, dtype=np.float64), self.frames)
+
+    def cross_sums(self, y):
+        '''
+        rows x grid matrix of sum(y * basis) of a prefix of y.shape[1] frames
+        '''
+        return y @ self.values[:, :y.shape[1]].T
+
+    def objective(self, y):
+        '''
+        rows x grid matrix of F of every row of y (rows x n) at every grid
+        rate, +inf where it is not finite
+        '''
+        n = y.shape[1]
+        with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+            sum_y = y.sum(axis=1)[:, None]
+            sum_x = self.sums[:, n - 1]
+            sum_x2 = self.square_sums[:, n - 1]
+            # centred sums, F = S_yy - S_xy^2 / S_xx, clipped at 0 against the
+            # rounding noise of exact fits. A degenerate basis only fits c.
+            s_xy = self.cross_sums(y) - sum_x * sum_y / n
+            s_xx = sum_x2 - sum_x * sum_x / n
+            s_yy = (y * y).sum(axis=1)[:, None] - sum_y * sum_y / n
+            res = np.where(degenerate_basis(s_xx * n, n, sum_x2), s_yy, np.maximum(s_yy - s_xy * s_xy / s_xx, 0))
+        return np.where(np.isfinite(res), res, np.inf)
+
+    def best(self, y, left, right, tie=0.0):
+        '''
+        Grid index of the best rate in [left, right] for every row of y, ties
+        to the left
+        '''
+        f = self.objective(y)
+        f[:, (self.coefs < left) | (self.coefs > right)] = np.inf
+        return np.argmax(f <= f.min(axis=1, keepdims=True) + np.reshape(tie, (-1, 1)), axis=1)
+
+    def brackets(self, y, left, right, tie=0.0):
+        '''
+        Per row of y, the grid neighbours of the best grid rate in [left,
+        right], clipped to [left, right]
+        '''
+        index = self.best(y, left, right, tie)
+        low = self.coefs[np.maximum(index - 1, 0)]
+        high = self.coefs[np.minimum(index + 1, len(self.coefs) - 1)]
+        return np.maximum(low, left), np.minimum(high, right)
+
+
+class ExpTable(BasisTable):
+    '''
+    BasisTable of exp_values. The rescaled basis of a prefix of n frames is
+    e^(-|b| m) over the distances m = 0..n - 1 from its largest frame, read
+    from the first frame for decay and from the last one for growth, so one
+    table of e^(-|b| m), all in (0, 1], serves every prefix without overflow.
+    '''
+    def grid_values(self, values_function):
+        return np.exp(-np.abs(self.coefs)[:, None] * np.arange(self.frames))
+
+    def cross_sums(self, y):
+        n = y.shape[1]
+        growth = self.coefs > 0
+        sums = y @ self.values[:, :n].T
+        sums[:, growth] = y[:, ::-1] @ self.values[growth, :n].T
+        return sums
+
+TABLE_TYPES = {
+    exp_values: ExpTable
+}
+
+BASIS_TABLES = {}
+
+def basis_table(values_function, frames):
+    '''
+    Cached BasisTable (ExpTable for exp_values) for at least frames frames (rounded up to
+    TABLE_FRAMES), built on first use
+    '''
+    frames = -(-frames // TABLE_FRAMES) * TABLE_FRAMES
+    key = (values_function, frames)
+    if key not in BASIS_TABLES:
+        BASIS_TABLES[key] = TABLE_TYPES.get(values_function, BasisTable)(values_function, frames)
+    return BASIS_TABLES[key]
+
+def prefix_LSM_exp(distances):
+    '''
+    LSM_exp forecast k * e^(b (n + 1)) + c after every prefix, from the
+    rescaled fit (k * e^(b (n + 1 - exp_shift)) + c, no overflow)
+    '''
+    coef, k, c, degenerate = prefix_fit(distances, exp_basis, exp_brackets, values_function=exp_values)
+    n = np.arange(1, coef.shape[1] + 1)
+    return forecast(exp_values, coef, k, c, n + 1, n)
+
+def prefix_LSM_hprbl(distances):
+    '''
+    Hyperbola forecast k / (n + 1 + b) + c after every prefix
+    '''
+    coef, k, c, degenerate = prefix_fit(distances, hprbl_basis, hprbl_brackets, values_function=hprbl_values)
+    n = np.arange(1, coef.shape[1] + 1)
+    return forecast(hprbl_values, coef, k, c, n + 1, n)
+
+
+class IncrementalFit:
+    '''
+    Streaming LSM_exp / LSM_hprbl fit: update(value) adds a frame (keeping
+    the last window frames, if set) and refits, predict() forecasts the next
+    frame. The rate barely moves between neighbouring prefixes, so every
+    bracket is refined from its previous optimum by secant steps on dF/db
+    inside +-width of it, falling back to a search of that window. Only when
+    there is no usable previous optimum or the minimum left the window is the
+    whole bracket looked up in the basis_table and refined around the best
+    grid rate. The sums of y and y^2 are kept across frames, a probe only
+    computes the basis sums. degenerate flags a fit with a numerically
+    constant basis (see linear_fit), whose forecast is the mean.
+    '''
+    def __init__(self, model='exp', window=None, width=WARM_WIDTH, eps=SEARCH_EPS, method='brent'):
+        self.brackets, self.values_function, self.slopes_function = FIT_MODELS[model][1:]
+        self.values = deque(maxlen=window)
+        self.sum_y = 0.0
+        self.sum_y2 = 0.0
+        self.width = width
+        self.eps = eps
+        self.method = method
+        self.warm = []
+        self.x = np.zeros(0)
+        self.coef, self.k, self.c = 0.0, 0.0, 0.0
+        self.degenerate = True
+        self.count = 0
+        self.evaluations = 0
+
+    def search(self, f, df, left, right, warm):
+        if warm is not None and left + EDGE_EPS < warm < right - EDGE_EPS:
+            low, high = max(left, warm - self.width), min(right, warm + self.width)
+            coef = secant_search(df, warm, low, high, self.eps)
+            if coef is not None:
+                return coef
+            coef = self.local_search(f, low, high, warm)
+            if (coef - low > EDGE_EPS or low == left) and (high - coef > EDGE_EPS or high == right):
+                return coef
+        # no previous optimum inside, one stuck on the bracket edge (a fast
+        # decay fitted to a single spike) that another basin may beat, or the
+        # minimum moved out of reach: best rate of the basis table, refined
+        # between its grid neighbours
+        table = basis_table(self.values_function, len(self.values))
+        index = table.best(self.ones_y[1][None], left, right, TIE_TOLERANCE * self.sum_y2)[0]
+        if table.coefs[index] in (left, right):
+            return table.coefs[index]
+        low = max(left, table.coefs[max(index - 1, 0)])
+        high = min(right, table.coefs[min(index + 1, len(table.coefs) - 1)])
+        return self.local_search(f, low, high, None)
+
+    def local_search(self, f, low, high, start):
+        if self.method == 'brent' and start is not None:
+            return brent_search(f, low, high, self.eps, start=start)
+        return MINIMIZERS[self.method](f, low, high, self.eps)
+
+    def linear_fit(self, coef):
+        '''
+        k, c, F, the basis and the degenerate flag at coef, from the basis sums
+        and the running sums of y and y^2
+        '''
+        n = len(self.values)
+        basis = self.values_function(coef, self.x, n)
+        sum_x, sum_xy = (self.ones_y @ basis).tolist()
+        sum_x2 = float(basis @ basis)
+        det = sum_x2 * n - sum_x * sum_x
+        if not det > CONSTANT_BASIS * n * sum_x2:
+            return 0.0, self.sum_y / n, max(self.sum_y2 - self.sum_y * self.sum_y / n, 0.0), basis, True
+        k = (sum_xy * n - sum_x * self.sum_y) / det
+        c = (sum_x2 * self.sum_y - sum_xy * sum_x) / det
+        res = self.sum_y2 - k * sum_xy - c * self.sum_y
+        return k, c, res if math.isfinite(res) else math.inf, basis, False
+
+    def residual(self, coef):
+        return self.linear_fit(coef)[2]
+
+    def gradient(self, coef):
+        '''
+        dF/db = -2 k sum((y - k basis - c) * dbasis/db) at the best k, c for coef
+        '''
+        k, c, residual, basis, degenerate = self.linear_fit(coef)
+        slopes = self.slopes_function(coef, self.x, basis, len(self.values))
+        sum_slopes, sum_y_slopes = (self.ones_y @ slopes).tolist()
+        return -2 * k * (sum_y_slopes - k * float(basis @ slopes) - c * sum_slopes)
+
+    def update(self, value):
+        if len(self.values) == self.values.maxlen:
+            self.sum_y -= self.values[0]
+            self.sum_y2 -= self.values[0] * self.values[0]
+        self.values.append(value)
+        self.count += 1
+        self.sum_y += value
+        self.sum_y2 += value * value
+        if self.values.maxlen is not None and self.count % self.values.maxlen == 0:
+            # resummed once per window against rounding drift of the subtractions
+            self.sum_y = math.fsum(self.values)
+            self.sum_y2 = math.fsum(v * v for v in self.values)
+        n = len(self.values)
+        if len(self.x) != n:
+            self.x = np.arange(1, n + 1, dtype=np.float64)
+            self.ones_y = np.ones((2, n))
+        self.ones_y[1] = self.values
+        with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+            if n == 1:
+                self.coef, self.k, self.c, self.degenerate = 0.0, 0.0, value, True
+                return
+            if n == 2:
+                # two frames are fitted exactly by any rate, take the fastest
+                # decay as prefix_fit does
+                self.coef = self.brackets(n)[0][0]
+                self.k, self.c, residual, basis, self.degenerate = self.linear_fit(self.coef)
+                return
+            f = CountingObjective(self.residual)
+            df = CountingObjective(self.gradient)
+            brackets = self.brackets(n)
+            warm = self.warm + [None] * (len(brackets) - len(self.warm))
+            best = math.inf
+            for i, ((left, right), start) in enumerate(zip(brackets, warm)):
+                coef = warm[i] = self.search(f, df, left, right, start)
+                k, c, residual, basis, degenerate = self.linear_fit(coef)
+                if residual < best:
+                    best = residual
+                    self.coef, self.k, self.c, self.degenerate = coef, k, c, degenerate
+            self.warm = warm[:len(brackets)]
+            self.evaluations += f.evaluations + df.evaluations
+
+    def predict(self):
+        n = len(self.values)
+        return float(forecast(self.values_function, self.coef, self.k, self.c, n + 1, n))
@@ -0,0 +1,237 @@
+'''
+One-dimensional minimizers for the nonlinear parameter of the LSM fits.
+
+ternary_search is the search of trenar_search_exp / trenar_search_hprbl: two
+fresh evaluations per iteration, shrinking the bracket by 1/3.
+golden_section_search reuses one probe per iteration and shrinks it by 0.382
+for a single evaluation, brent_search adds parabolic steps on top of it.
+All stop when the bracket is narrower than eps.
+secant_search refines a minimum that is already close from the derivative,
+for the warm started refits of lsm_fit.IncrementalFit.
+
+The batch_* versions minimize one function per row of a batch, with every
+row keeping its own bracket. CountingObjective counts evaluations (rows for
+the batch versions), so the methods can be compared at equal eps.
+'''
+import math, argparse
+
+import numpy as np
+
+SEARCH_EPS = 1e-6
+SEARCH_METHOD = 'golden'
+GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+SECANT_STEP = 1e-3
+SECANT_ITERATIONS = 8
+
+
+class CountingObjective:
+    def __init__(self, f):
+        self.f = f
+        self.evaluations = 0
+
+    def __call__(self, x, *args):
+        self.evaluations += np.size(x)
+        return self.f(x, *args)
+
+
+def ternary_search(f, left, right, eps=SEARCH_EPS):
+    while right > left + eps:
+        t = (right - left) / 3
+        a = left + t
+        b = right - t
+        if f(a) < f(b):
+            right = b
+        else:
+            left = a
+    return (left + right) / 2
+
+def golden_section_search(f, left, right, eps=SEARCH_EPS):
+    c = right - GOLDEN_RATIO * (right - left)
+    d = left + GOLDEN_RATIO * (right - left)
+    f_c = f(c)
+    f_d = f(d)
+    while right > left + eps:
+        if f_c < f_d:
+            right, d, f_d = d, c, f_c
+            c = right - GOLDEN_RATIO * (right - left)
+            f_c = f(c)
+        else:
+            left, c, f_c = c, d, f_d
+            d = left + GOLDEN_RATIO * (right - left)
+            f_d = f(d)
+    return (left + right) / 2
+
+def brent_search(f, left, right, eps=SEARCH_EPS, start=None):
+    '''
+    Brent's bounded minimization: a parabola through the three best points
+    when it falls well inside the bracket, a golden section step otherwise.
+    start (e.g. a previous optimum) replaces the first golden section probe.
+    '''
+    golden = 1 - GOLDEN_RATIO
+    sqrt_machine_eps = math.sqrt(np.finfo(float).eps)
+    x = w = v = left + golden * (right - left) if start is None else start
+    f_x = f_w = f_v = f(x)
+    step = previous_step = 0.0
+    while True:
+        middle = (left + right) / 2
+        tol = sqrt_machine_eps * abs(x) + eps / 3
+        if abs(x - middle) <= 2 * tol - (right - left) / 2:
+            return x
+        parabolic = False
+        if abs(previous_step) > tol:
+            r = (x - w) * (f_x - f_v)
+            q = (x - v) * (f_x - f_w)
+            p = (x - v) * q - (x - w) * r
+            q = 2 * (q - r)
+            if q > 0:
+                p = -p
+            q = abs(q)
+            older_step, previous_step = previous_step, step
+            if abs(p) < abs(q * older_step / 2) and q * (left - x) < p < q * (right - x):
+                parabolic = True
+                step = p / q
+                if x + step - left < 2 * tol or right - x - step < 2 * tol:
+                    step = tol if middle >= x else -tol
+        if not parabolic:
+            previous_step = (left if x >= middle else right) - x
+            step = golden * previous_step
+        u = x + (step if abs(step) >= tol else math.copysign(tol, step))
+        f_u = f(u)
+        if f_u <= f_x:
+            if u >= x:
+                left = x
+            else:
+                right = x
+            v, f_v, w, f_w, x, f_x = w, f_w, x, f_x, u, f_u
+        else:
+            if u < x:
+                left = u
+            else:
+                right = u
+            if f_u <= f_w or w == x:
+                v, f_v, w, f_w = w, f_w, u, f_u
+            elif f_u <= f_v or v == x or v == w:
+                v, f_v = u, f_u
+
+def secant_search(df, start, left, right, eps=SEARCH_EPS, step=SECANT_STEP, iterations=SECANT_ITERATIONS):
+    '''
+    Minimum near start from the derivative df alone: secant steps towards
+    df = 0, the first one from start and start +- step. None when a step
+    leaves [left, right], df is not increasing (no minimum in reach) or it
+    has not converged in iterations steps.
+    '''
+    x_0, df_0 = start, df(start)
+    x_1 = start - math.copysign(step, df_0)
+    for i in range(iterations):
+        df_1 = df(x_1)
+        curvature = (df_1 - df_0) / (x_1 - x_0)
+        if not curvature > 0 or not math.isfinite(curvature):
+            return None
+        x_0, df_0 = x_1, df_1
+        x_1 = x_1 - df_1 / curvature
+        if not left < x_1 < right:
+            return None
+        if abs(x_1 - x_0) < eps:
+            return x_1
+    return None
+
+MINIMIZERS = {
+    'ternary': ternary_search,
+    'golden': golden_section_search,
+    'brent': brent_search
+}
+
+def minimize(f, left, right, method=SEARCH_METHOD, eps=SEARCH_EPS):
+    '''
+    (argmin, minimum, evaluations) of f on [left, right]
+    '''
+    counted = CountingObjective(f)
+    x = MINIMIZERS[method](counted, left, right, eps)
+    return x, f(x), counted.evaluations
+
+
+def shrink_right(f_a, f_b, tie):
+    '''
+    Rows whose bracket keeps its left part: a not worse than b up to tie, or
+    b overflowing
+    '''
+    return (f_a <= f_b + tie) | np.isinf(f_b)
+
+def batch_ternary_search(f, left, right, eps=SEARCH_EPS, tie=0.0):
+    '''
+    ternary_search of f(coef, rows) for every row, rows stop as soon as their
+    own bracket is narrower than eps
+    '''
+    tie = np.broadcast_to(tie, left.shape)
+    rows = np.nonzero(right > left + eps)[0]
+    while len(rows):
+        t = (right[rows] - left[rows]) / 3
+        a = left[rows] + t
+        b = right[rows] - t
+        closer = shrink_right(f(a, rows), f(b, rows), tie[rows])
+        right[rows] = np.where(closer, b, right[rows])
+        left[rows] = np.where(closer, left[rows], a)
+        rows = rows[right[rows] > left[rows] + eps]
+    return (left + right) / 2
+
+def batch_golden_section_search(f, left, right, eps=SEARCH_EPS, tie=0.0):
+    '''
+    golden_section_search of f(coef, rows) for every row, one evaluation per
+    row and iteration
+    '''
+    tie = np.broadcast_to(tie, left.shape)
+    all_rows = np.arange(len(left))
+    c = right - GOLDEN_RATIO * (right - left)
+    d = left + GOLDEN_RATIO * (right - left)
+    f_c = f(c, all_rows)
+    f_d = f(d, all_rows)
+    rows = np.nonzero(right > left + eps)[0]
+    while len(rows):
+        closer = shrink_right(f_c[rows], f_d[rows], tie[rows])
+        kept, moved = rows[closer], rows[~closer]
+        right[kept], d[kept], f_d[kept] = d[kept], c[kept], f_c[kept]
+        c[kept] = right[kept] - GOLDEN_RATIO * (right[kept] - left[kept])
+        left[moved], c[moved], f_c[moved] = c[moved], d[moved], f_d[moved]
+        d[moved] = left[moved] + GOLDEN_RATIO * (right[moved] - left[moved])
+        probe = np.where(closer, c[rows], d[rows])
+        f_probe = f(probe, rows)
+        f_c[kept] = f_probe[closer]
+        f_d[moved] = f_probe[~closer]
+        rows = rows[right[rows] > left[rows] + eps]
+    return (left + right) / 2
+
+BATCH_MINIMIZERS = {
+    'ternary': batch_ternary_search,
+    'golden': batch_golden_section_search
+}
+
+
+if __name__ == '__main__':
+    from lsm_fit import exp_basis, hprbl_basis, objective
+
+    parser = argparse.ArgumentParser(description='Evaluations of the minimizers on random LSM fits')
+    parser.add_argument('--fits', type=int, default=200)
+    parser.add_argument('--frames', type=int, default=30)
+    parser.add_argument('--eps', type=float, default=SEARCH_EPS)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    x = np.arange(1, args.frames + 1, dtype=np.float64)
+    for name, basis_function, bracket in [('exp', exp_basis, (-1.0, 1.0)), ('hprbl', hprbl_basis, (-0.999, 10.0))]:
+        series = []
+        for i in range(args.fits):
+            rate = rng.uniform(0.2, 2.0)
+            series.append(rng.uniform(0.01, 0.1) / (x + rate) + rng.normal(0, 0.001, args.frames))
+        results = {}
+        for method in MINIMIZERS:
+            evaluations = 0
+            results[method] = []
+            for y in series:
+                f = lambda coef: objective(basis_function, np.array([coef]), x, y[None])[0]
+                argmin, minimum, count = minimize(f, bracket[0], bracket[1], method, args.eps)
+                results[method].append(minimum)
+                evaluations += count
+            print('%-6s %-8s %8.1f evaluations per fit' % (name, method, evaluations / args.fits))
+        for method in MINIMIZERS:
+            gap = np.max(np.array(results[method]) - np.array(results['ternary']))
+            print('%-6s %-8s largest residual above ternary %.3e' % (name, method, gap))
@@ -0,0 +1,582 @@
+'''
+Columnar binary cache for precalc_* and precalc_distance_* directories.
+
+Every directory of per-clip JSON files is parsed once into a NumPy array
+saved as .npy under PRECALC_CACHE_DIRECTORY. Later loads open the array
+memory-mapped instead of reparsing thousands of small files.
+
+The float64 values are the master copy. A float32 copy (STORAGE_DTYPES) is
+derived from it on request and rebuilt whenever the master changes; it
+halves memory and bandwidth at the precision cost measured by
+precision_report.py. Updates and derivations run under a per-cache file
+lock, so several processes may open the same directory.
+
+Clips may have any number of frames, so a directory is stored CSR-style
+(see ragged.RaggedArray): the frames of all clips back to back plus the
+[start, length] span of each clip in the index.
+
+precalc_<method>_<dataset>          -> frames x 4 values
+                                       (error, estimation, timing, timing)
+precalc_distance_<method>_<dataset> -> flat frame distances
+'''
+import os, io, json, time, uuid, hashlib, warnings, argparse
+from contextlib import contextmanager
+from itertools import chain, repeat
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks (Windows), only the per-process temporary names remain
+    fcntl = None
+
+import numpy as np
+
+from ragged import RaggedArray
+
+PRECALC_CACHE_DIRECTORY = './precalc_cache'
+
+ALL_DATASETS = ['midv500', 'midv2019', 'ic15', 'yvt']
+ALL_METHODS = ['base', 'summation', 'treap']
+
+PRECALC_DIRECTORY_PATTERNS = {
+    'precalc': './precalc_%s_%s',
+    'distance': './precalc_distance_%s_%s'
+}
+
+ERROR_COLUMN = 0
+ESTIMATION_COLUMN = 1
+TIMING_COLUMNS = [2, 3]
+
+INGEST_CHUNK_SIZE = 256
+DERIVE_BLOCK_FRAMES = 1 << 20
+COMPACT_FRACTION = 0.25
+
+VALUES_FILE = 'values.npy'
+INDEX_FILE = 'index.json'
+LOCK_FILE = 'lock'
+
+STORAGE_DTYPES = ['float64', 'float32']
+
+
+def precalc_directory(dataset, method, kind='precalc'):
+    '''
+    Source directory of a (dataset, method, kind) triple, kind is 'precalc' or 'distance'
+    '''
+    return PRECALC_DIRECTORY_PATTERNS[kind] % (method, dataset)
+
+def cache_directory(precalc_dir):
+    '''
+    Directory holding the cached arrays for a precalc directory
+    '''
+    return os.path.join(PRECALC_CACHE_DIRECTORY, os.path.basename(os.path.normpath(precalc_dir)))
+
+def temp_path(path):
+    '''
+    Per-process temporary name next to path, replaced onto it when complete
+    '''
+    return '%s.%d.tmp' % (path, os.getpid())
+
+@contextmanager
+def cache_lock(precalc_dir):
+    '''
+    Holds the advisory lock of the cache of precalc_dir, so that processes
+    sharing the cache update it and derive its copies one at a time
+    '''
+    cache_dir = cache_directory(precalc_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, LOCK_FILE), 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+def list_clip_files(precalc_dir):
+    '''
+    Sorted names of the per-clip .json files of a precalc directory
+    '''
+    return sorted([x for x in os.listdir(precalc_dir) if x.endswith('.json')])
+
+def clip_id(file_name):
+    return os.path.splitext(file_name)[0]
+
+def read_clip_file(path):
+    '''
+    Parsed clip record and the sha1 of the file contents
+    '''
+    with open(path, 'rb') as js:
+        content = js.read()
+    return json.loads(content), hashlib.sha1(content).hexdigest()
+
+def file_hash(path):
+    with open(path, 'rb') as js:
+        return hashlib.sha1(js.read()).hexdigest()
+
+def stat_entry(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime': st.st_mtime}
+
+def count_frames(content, trailing_shape):
+    '''
+    Number of frames of a JSON clip record, counted from its brackets (or
+    commas for flat records) without parsing the numbers
+    '''
+    if trailing_shape:
+        brackets = sum([int(np.prod(trailing_shape[:k])) for k in range(len(trailing_shape))])
+        return (content.count(b'[') - 1) // brackets
+    if not content.strip()[1:-1].strip():
+        return 0
+    return content.count(b',') + 1
+
+def clip_lengths(precalc_dir, files, trailing_shape):
+    '''
+    Frame counts of files. A record without frames is rejected: no stopping
+    rule can be evaluated on it.
+    '''
+    lengths = []
+    for precalc_file in files:
+        with open(os.path.join(precalc_dir, precalc_file), 'rb') as js:
+            length = count_frames(js.read(), trailing_shape)
+        if length <= 0:
+            raise ValueError('%s: %s has no frames' % (precalc_dir, precalc_file))
+        lengths.append(length)
+    return lengths
+
+def write_files(precalc_dir, files, trailing_shape, values_path, starts, lengths):
+    '''
+    Parses files and writes each into rows start..start + length of the
+    preallocated values array. Returns the content hashes.
+    '''
+    values = np.load(values_path, mmap_mode='r+')
+    hashes = []
+    for precalc_file, start, length in zip(files, starts, lengths):
+        record, sha1 = read_clip_file(os.path.join(precalc_dir, precalc_file))
+        record = np.asarray(record, dtype=values.dtype)
+        if record.shape[1:] != tuple(trailing_shape):
+            raise ValueError('%s: %s has frames of shape %s, expected %s' % \
+                             (precalc_dir, precalc_file, record.shape[1:], tuple(trailing_shape)))
+        if len(record) != length:
+            raise ValueError('%s: %s changed while it was ingested' % (precalc_dir, precalc_file))
+        values[start:start + length] = record
+        hashes.append(sha1)
+    values.flush()
+    return hashes
+
+def ingest_files(precalc_dir, files, trailing_shape, values_path, place, workers=None, executor='process'):
+    '''
+    Parses files into the on-disk values array, with workers > 1 in chunks on
+    a process (or thread) pool. A first pass only counts the frames of every
+    file, place(lengths) then returns the start row of every file (growing the
+    array as needed) and each worker writes its rows straight into the
+    memory-mapped array. Returns (lengths, starts, manifest entries).
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    stats = {}
+    for precalc_file in files:
+        stats[precalc_file] = stat_entry(os.path.join(precalc_dir, precalc_file))
+
+    chunk_size = max(1, min(INGEST_CHUNK_SIZE, len(files) // workers))
+    bounds = range(0, len(files), chunk_size)
+    chunks = [files[i:i + chunk_size] for i in bounds]
+    pool = None
+    if workers > 1 and len(chunks) > 1:
+        pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        pool = pool_class(max_workers=workers)
+    run = map if pool is None else pool.map
+    try:
+        lengths = list(chain.from_iterable(run(clip_lengths, repeat(precalc_dir), chunks, repeat(trailing_shape))))
+        starts = [int(x) for x in place(lengths)]
+        hashes = list(chain.from_iterable(run(write_files, repeat(precalc_dir), chunks, repeat(trailing_shape), \
+                                              repeat(values_path), [starts[i:i + chunk_size] for i in bounds], \
+                                              [lengths[i:i + chunk_size] for i in bounds])))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    manifest = {}
+    for precalc_file, sha1 in zip(files, hashes):
+        manifest[precalc_file] = dict(stats[precalc_file], sha1=sha1)
+    return lengths, starts, manifest
+
+def read_index(precalc_dir):
+    index_file = os.path.join(cache_directory(precalc_dir), INDEX_FILE)
+    if not os.path.exists(index_file):
+        return None
+    with open(index_file) as js:
+        return json.load(js)
+
+def write_index(precalc_dir, index):
+    index['version'] = uuid.uuid4().hex
+    index_file = os.path.join(cache_directory(precalc_dir), INDEX_FILE)
+    tmp = temp_path(index_file)
+    with open(tmp, 'w') as js:
+        json.dump(index, js)
+    os.replace(tmp, index_file)
+
+def grow_values(values_path, count):
+    '''
+    Appends count zero rows to an .npy file. Only the header is rewritten when
+    the new shape fits in it, otherwise the file is copied once.
+    Returns the index of the first new row.
+    '''
+    with open(values_path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+        new_shape = (shape[0] + count,) + shape[1:]
+        header = io.BytesIO()
+        header_data = {
+            'descr': np.lib.format.dtype_to_descr(dtype),
+            'fortran_order': fortran_order,
+            'shape': new_shape
+        }
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, header_data)
+        else:
+            np.lib.format.write_array_header_2_0(header, header_data)
+        if len(header.getvalue()) == offset:
+            f.seek(0)
+            f.write(header.getvalue())
+            f.truncate(offset + int(np.prod(new_shape)) * dtype.itemsize)
+            return shape[0]
+
+    old = np.load(values_path, mmap_mode='r')
+    tmp = temp_path(values_path)
+    grown = np.lib.format.open_memmap(tmp, mode='w+', dtype=old.dtype, shape=new_shape)
+    grown[:shape[0]] = old
+    grown.flush()
+    del grown, old
+    os.replace(tmp, values_path)
+    return shape[0]
+
+def packed_starts(start, lengths):
+    '''
+    Start rows of clips of the given lengths stored back to back from start
+    '''
+    return start + np.cumsum([0] + list(lengths[:-1]), dtype=np.int64)
+
+def build_cache(precalc_dir, workers=None, executor='process'):
+    '''
+    Parses every clip file of precalc_dir into a new cache.
+    Returns the number of parsed files.
+    '''
+    files = list_clip_files(precalc_dir)
+    if not files:
+        raise ValueError('%s: no clip files' % precalc_dir)
+
+    cache_dir = cache_directory(precalc_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.exists(os.path.join(cache_dir, INDEX_FILE)):
+        os.remove(os.path.join(cache_dir, INDEX_FILE))
+    values_path = os.path.join(cache_dir, VALUES_FILE)
+    first = np.asarray(read_clip_file(os.path.join(precalc_dir, files[0]))[0], dtype=np.float64)
+    if first.size == 0:
+        raise ValueError('%s: %s has no frames' % (precalc_dir, files[0]))
+    trailing_shape = first.shape[1:]
+
+    def preallocate(lengths):
+        np.lib.format.open_memmap(values_path, mode='w+', dtype=np.float64, shape=(sum(lengths),) + trailing_shape)
+        return packed_starts(0, lengths)
+
+    lengths, starts, manifest = ingest_files(precalc_dir, files, trailing_shape, values_path, preallocate, \
+                                             workers, executor)
+    spans = [[start, length] for start, length in zip(starts, lengths)]
+    index = {
+        'source': os.path.abspath(precalc_dir),
+        'files': files,
+        'spans': spans,
+        'manifest': manifest
+    }
+    write_index(precalc_dir, index)
+    return len(files)
+
+def diff_manifest(precalc_dir, manifest):
+    '''
+    Compares a directory with its manifest. A file whose size or mtime moved
+    counts as changed only if its content hash differs too; otherwise it is
+    returned as touched so the manifest can take the new stat.
+    Returns (added, changed, deleted, touched) file names.
+    '''
+    files = list_clip_files(precalc_dir)
+    added = []
+    changed = []
+    touched = {}
+    for precalc_file in files:
+        path = os.path.join(precalc_dir, precalc_file)
+        entry = stat_entry(path)
+        old = manifest.get(precalc_file)
+        if old is None:
+            added.append(precalc_file)
+        elif old['size'] != entry['size'] or old['mtime'] != entry['mtime']:
+            if file_hash(path) != old['sha1']:
+                changed.append(precalc_file)
+            else:
+                touched[precalc_file] = entry
+    present = set(files)
+    deleted = [x for x in manifest if x not in present]
+    return added, changed, deleted, touched
+
+def compact_cache(precalc_dir):
+    '''
+    Rewrites the values array without the frames of deleted or moved clips
+    '''
+    index = read_index(precalc_dir)
+    values_path = os.path.join(cache_directory(precalc_dir), VALUES_FILE)
+    stored = load_spans(np.load(values_path, mmap_mode='r'), index['spans'])
+    tmp = temp_path(values_path)
+    compacted = np.lib.format.open_memmap(tmp, mode='w+', dtype=stored.values.dtype, shape=stored.values.shape)
+    compacted[:] = stored.values
+    compacted.flush()
+    del compacted, stored
+    os.replace(tmp, values_path)
+    starts = np.cumsum([0] + [length for start, length in index['spans']])
+    index['spans'] = [[int(starts[i]), length] for i, (start, length) in enumerate(index['spans'])]
+    write_index(precalc_dir, index)
+
+def update_cache(precalc_dir, workers=None, executor='process'):
+    '''
+    Brings the cache of precalc_dir up to date with the directory. Only added
+    or changed clips are parsed: a changed clip of unchanged length is
+    rewritten in place, other changed clips and added clips are appended and
+    deleted clips are dropped from the index. The array is compacted once
+    more than COMPACT_FRACTION of its frames are dead.
+    Returns the number of parsed files.
+    '''
+    index = read_index(precalc_dir)
+    values_path = os.path.join(cache_directory(precalc_dir), VALUES_FILE)
+    if index is None or 'spans' not in index or not os.path.exists(values_path):
+        return build_cache(precalc_dir, workers, executor)
+    manifest = index['manifest']
+    added, changed, deleted, touched = diff_manifest(precalc_dir, manifest)
+    if not (added or changed or deleted or touched):
+        return 0
+
+    files = index['files']
+    spans = index['spans']
+    trailing_shape = np.load(values_path, mmap_mode='r').shape[1:]
+    for precalc_file, entry in touched.items():
+        manifest[precalc_file].update(entry)
+    old_spans = dict(zip(files, spans))
+    parsed = changed + added
+
+    def appended(lengths):
+        # changed clips of unchanged length keep their rows, the others are appended
+        return [i for i in range(len(parsed)) if parsed[i] not in old_spans or old_spans[parsed[i]][1] != lengths[i]]
+
+    def place(lengths):
+        moved = appended(lengths)
+        starts = [old_spans[x][0] if x in old_spans else 0 for x in parsed]
+        if moved:
+            start = grow_values(values_path, sum([lengths[i] for i in moved]))
+            for i, moved_start in zip(moved, packed_starts(start, [lengths[i] for i in moved])):
+                starts[i] = moved_start
+        return starts
+
+    lengths, starts, parsed_manifest = ingest_files(precalc_dir, parsed, trailing_shape, values_path, place, \
+                                                    workers, executor)
+    manifest.update(parsed_manifest)
+    moved = appended(lengths)
+    removed = set(deleted) | set([parsed[i] for i in moved])
+    if removed:
+        kept = [i for i in range(len(files)) if files[i] not in removed]
+        files = [files[i] for i in kept]
+        spans = [spans[i] for i in kept]
+        for precalc_file in deleted:
+            del manifest[precalc_file]
+    for i in moved:
+        files.append(parsed[i])
+        spans.append([starts[i], lengths[i]])
+
+    index['files'] = files
+    index['spans'] = spans
+    index['manifest'] = manifest
+    write_index(precalc_dir, index)
+    total_frames = np.load(values_path, mmap_mode='r').shape[0]
+    live_frames = sum([length for start, length in spans])
+    if total_frames - live_frames > COMPACT_FRACTION * total_frames:
+        compact_cache(precalc_dir)
+    return len(added) + len(changed)
+
+def ensure_cache(precalc_dir, rebuild=False, dtype='float64'):
+    '''
+    Updates (or rebuilds) the cache of precalc_dir and its copy in a storage
+    dtype under the cache lock. Returns the path of that copy.
+    '''
+    with cache_lock(precalc_dir):
+        if rebuild:
+            build_cache(precalc_dir)
+        else:
+            update_cache(precalc_dir)
+        return storage_path(precalc_dir, dtype)
+
+def manifest_digest(precalc_dir):
+    '''
+    Digest of the clip files and contents recorded in the cache index, the
+    same for any cache of the same directory contents
+    '''
+    manifest = read_index(precalc_dir)['manifest']
+    entries = sorted([[precalc_file, manifest[precalc_file]['sha1']] for precalc_file in manifest])
+    return hashlib.sha1(json.dumps(entries).encode('utf-8')).hexdigest()
+
+def load_spans(values, spans):
+    '''
+    RaggedArray of the clips at the given [start, length] spans of values,
+    zero-copy when the spans tile values in order
+    '''
+    spans = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+    offsets = np.zeros(len(spans) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(spans[:, 1])
+    if offsets[-1] == len(values) and np.array_equal(spans[:, 0], offsets[:-1]):
+        return RaggedArray(values, offsets)
+    return RaggedArray.from_spans(values, spans)
+
+def storage_path(precalc_dir, dtype='float64'):
+    '''
+    On-disk values of the cache in a storage dtype. Non-float64 copies are
+    (re)derived from the float64 master when its index version has moved.
+    '''
+    cache_dir = cache_directory(precalc_dir)
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError('unsupported storage dtype %s' % dtype)
+    if dtype == 'float64':
+        return os.path.join(cache_dir, VALUES_FILE)
+    path = os.path.join(cache_dir, 'values.%s.npy' % dtype)
+    version_file = path + '.version'
+    index = read_index(precalc_dir)
+    if 'version' not in index:
+        write_index(precalc_dir, index)
+    version = index['version']
+    if os.path.exists(path) and os.path.exists(version_file):
+        with open(version_file) as f:
+            if f.read() == version:
+                return path
+    master = np.load(os.path.join(cache_dir, VALUES_FILE), mmap_mode='r')
+    tmp = temp_path(path)
+    if len(master) == 0:
+        with open(tmp, 'wb') as f:
+            np.save(f, np.zeros(master.shape, dtype=dtype))
+    else:
+        derived = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=master.shape)
+        for start in range(0, len(master), DERIVE_BLOCK_FRAMES):
+            derived[start:start + DERIVE_BLOCK_FRAMES] = master[start:start + DERIVE_BLOCK_FRAMES]
+        derived.flush()
+        del derived
+    os.replace(tmp, path)
+    with open(temp_path(version_file), 'w') as f:
+        f.write(version)
+    os.replace(temp_path(version_file), version_file)
+    return path
+
+def open_directory(precalc_dir, rebuild=False, dtype='float64'):
+    '''
+    Memory-mapped values and clip [start, length] spans of a precalc directory
+    in index order, updating the cache if needed
+    '''
+    values = np.load(ensure_cache(precalc_dir, rebuild, dtype), mmap_mode='r')
+    return values, np.asarray(read_index(precalc_dir)['spans'], dtype=np.int64).reshape(-1, 2)
+
+def load_directory(precalc_dir, rebuild=False, dtype='float64'):
+    '''
+    RaggedArray of a precalc directory in index order, updating the cache if
+    needed. The values are memory-mapped unless dead frames are pending compaction.
+    '''
+    return load_spans(*open_directory(precalc_dir, rebuild, dtype))
+
+def load_precalc(precalc_dir, rebuild=False, dtype='float64'):
+    '''
+    Ragged clips x frames x 4 values of a precalc_<method>_<dataset> directory
+    '''
+    values = load_directory(precalc_dir, rebuild, dtype)
+    if values.values.ndim != 2:
+        raise ValueError('%s: expected frames x 4 values, got shape %s' % (precalc_dir, values.values.shape))
+    return values
+
+def load_precalc_distance(precalc_dist_dir, rebuild=False, dtype='float64'):
+    '''
+    Ragged clips x frames distances of a precalc_distance_<method>_<dataset> directory
+    '''
+    values = load_directory(precalc_dist_dir, rebuild, dtype)
+    if values.values.ndim != 1:
+        raise ValueError('%s: expected flat distances, got shape %s' % (precalc_dist_dir, values.values.shape))
+    return values
+
+def load_clip_ids(precalc_dir, rebuild=False):
+    '''
+    Clip ids (file names without extension) in index order
+    '''
+    ensure_cache(precalc_dir, rebuild)
+    return [clip_id(x) for x in read_index(precalc_dir)['files']]
+
+def join_clip_ids(precalc_ids, distance_ids, name=''):
+    '''
+    Pairs precalc and distance rows by clip id. Returns a 2 x clips index
+    array (precalc rows, distance rows); clips found on one side only are
+    reported and left out.
+    '''
+    distance_index = {}
+    for i, c in enumerate(distance_ids):
+        distance_index[c] = i
+    precalc_rows = []
+    distance_rows = []
+    missing_distance = []
+    for i, c in enumerate(precalc_ids):
+        j = distance_index.pop(c, None)
+        if j is None:
+            missing_distance.append(c)
+            continue
+        precalc_rows.append(i)
+        distance_rows.append(j)
+    if missing_distance or distance_index:
+        warnings.warn('%s: %d clips have no distances (%s), %d distance clips have no precalc (%s)' % \
+                      (name, len(missing_distance), ', '.join(missing_distance[:5]), \
+                       len(distance_index), ', '.join(sorted(distance_index)[:5])))
+    return np.array([precalc_rows, distance_rows], dtype=np.intp).reshape(2, -1)
+
+def load_clip_index(precalc_dir, precalc_dist_dir, rebuild=False):
+    '''
+    Clip index joining a precalc directory with its distance directory
+    '''
+    return join_clip_ids(load_clip_ids(precalc_dir, rebuild), load_clip_ids(precalc_dist_dir, rebuild), \
+                         os.path.basename(os.path.normpath(precalc_dir)))
+
+def ingest_all(datasets=ALL_DATASETS, methods=ALL_METHODS, workers=None, executor='process', full=False):
+    '''
+    Updates (or with full=True rebuilds) the cache of every (dataset, method, kind)
+    directory, printing parsed files/sec
+    '''
+    total_files = 0
+    total_start = time.time()
+    for dataset in datasets:
+        for method in methods:
+            for kind in PRECALC_DIRECTORY_PATTERNS:
+                precalc_dir = precalc_directory(dataset, method, kind)
+                if not os.path.isdir(precalc_dir):
+                    print('%s: missing, skipped' % precalc_dir)
+                    continue
+                start = time.time()
+                with cache_lock(precalc_dir):
+                    if full:
+                        count = build_cache(precalc_dir, workers, executor)
+                    else:
+                        count = update_cache(precalc_dir, workers, executor)
+                elapsed = max(time.time() - start, 1e-9)
+                total_files += count
+                print('%s: %d files parsed in %.2f s, %.0f files/sec' % (precalc_dir, count, elapsed, count / elapsed))
+    elapsed = max(time.time() - total_start, 1e-9)
+    print('total: %d files parsed in %.2f s, %.0f files/sec' % (total_files, elapsed, total_files / elapsed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or update the precalc caches')
+    parser.add_argument('--datasets', nargs='+', default=ALL_DATASETS)
+    parser.add_argument('--methods', nargs='+', default=ALL_METHODS)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--executor', choices=['process', 'thread'], default='process')
+    parser.add_argument('--full', action='store_true', help='rebuild instead of updating incrementally')
+    args = parser.parse_args()
+    ingest_all(args.datasets, args.methods, args.workers, args.executor, args.full)
@@ -0,0 +1,72 @@
+'''
+Accuracy report of the float32 storage mode.
+
+For every (dataset, method) with precalc directories, the EPP and ROC curves
+are computed from float64 and from float32 storage and the largest absolute
+difference between them is printed, together with the memory of both copies.
+'''
+import os, argparse
+
+import numpy as np
+
+from precalc_store import ALL_DATASETS, ALL_METHODS, precalc_directory, \
+                          load_precalc, load_precalc_distance, load_clip_index
+from epp import clip_errors, modelling_scores, threshold_epp, greedy_roc
+
+
+def load_table(dataset, method, dtype):
+    precalc_dir = precalc_directory(dataset, method, 'precalc')
+    precalc_dist_dir = precalc_directory(dataset, method, 'distance')
+    clip_index = load_clip_index(precalc_dir, precalc_dist_dir)
+    precalc = load_precalc(precalc_dir, dtype=dtype)[clip_index[0]]
+    precalc_dist = load_precalc_distance(precalc_dist_dir, dtype=dtype)[clip_index[1]]
+    return precalc, precalc_dist
+
+def curves(precalc, precalc_dist):
+    errors = clip_errors(precalc)
+    return {
+        'modelling_epp': threshold_epp(modelling_scores(precalc), errors),
+        'distance_epp': threshold_epp(precalc_dist, errors),
+        'distance_roc': greedy_roc(precalc_dist, errors)
+    }
+
+def curve_difference(reference, curve):
+    '''
+    Largest |dx| and |dy| between two curves. Curves of different length
+    (float32 may break or merge ties) are compared as y over x.
+    '''
+    x, y = np.asarray(reference[0]), np.asarray(reference[1])
+    x_32, y_32 = np.asarray(curve[0]), np.asarray(curve[1])
+    if len(x) == len(x_32):
+        return float(np.abs(x - x_32).max(initial=0)), float(np.abs(y - y_32).max(initial=0))
+    order = np.argsort(x, kind='stable')
+    order_32 = np.argsort(x_32, kind='stable')
+    return float('nan'), float(np.abs(np.interp(x_32[order_32], x[order], y[order]) - y_32[order_32]).max(initial=0))
+
+def precision_report(datasets=ALL_DATASETS, methods=ALL_METHODS):
+    rows = []
+    for dataset in datasets:
+        for method in methods:
+            if not os.path.isdir(precalc_directory(dataset, method, 'precalc')) or \
+               not os.path.isdir(precalc_directory(dataset, method, 'distance')):
+                continue
+            table = load_table(dataset, method, 'float64')
+            table_32 = load_table(dataset, method, 'float32')
+            reference = curves(*table)
+            result = curves(*table_32)
+            for name in reference:
+                dx, dy = curve_difference(reference[name], result[name])
+                rows.append([dataset, method, name, dx, dy, \
+                             sum(x.nbytes for x in table), sum(x.nbytes for x in table_32)])
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare EPP/ROC curves of float32 and float64 storage')
+    parser.add_argument('--datasets', nargs='+', default=ALL_DATASETS)
+    parser.add_argument('--methods', nargs='+', default=ALL_METHODS)
+    args = parser.parse_args()
+    print('%-10s %-10s %-14s %12s %12s %10s %10s' % ('dataset', 'method', 'curve', 'max |dx|', 'max |dy|', 'MB f64', 'MB f32'))
+    for dataset, method, name, dx, dy, nbytes, nbytes_32 in precision_report(args.datasets, args.methods):
+        print('%-10s %-10s %-14s %12.3e %12.3e %10.1f %10.1f' % (dataset, method, name, dx, dy, \
+                                                               nbytes / 1024 ** 2, nbytes_32 / 1024 ** 2))
@@ -0,0 +1,90 @@
+'''
+Process-wide cache of prefix forecast matrices for the score builders of epp.py.
+
+The EPP collectors of test2.py and the roc_curve_* builders of test3.py score
+the same clip blocks with the same models (the lagged ROC scores and the
+stopper scores above threshold 1.0 need one matrix, the clip_start 1 stopper
+scores and the LSM_exp ROC scores another). cached_predictions keys a
+prefix_predictions matrix by (model, params, block), where the block is
+identified by a digest of its padded distances, so a figure run fits every
+(model, dataset, method, block) once whichever builder asks first.
+Entries are evicted least recently used above a memory cap.
+'''
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from predictors import prefix_predictions
+
+PREDICTION_CACHE_MEMORY_LIMIT = 1024 ** 3
+
+
+def block_digest(distances):
+    return distances.shape, hashlib.blake2b(np.ascontiguousarray(distances).tobytes(), digest_size=16).hexdigest()
+
+
+class PredictionCache:
+    def __init__(self, memory_limit=PREDICTION_CACHE_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        '''
+        Cached matrix for key, or None
+        '''
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, values):
+        if values.nbytes > self.memory_limit:
+            return
+        while self.entries and self.nbytes + values.nbytes > self.memory_limit:
+            self.nbytes -= self.entries.popitem(last=False)[1].nbytes
+            self.evictions += 1
+        self.entries[key] = values
+        self.nbytes += values.nbytes
+
+    def predictions(self, distances, model, *args):
+        '''
+        prefix_predictions(distances, model, *args), read-only
+        '''
+        key = (model, args) + block_digest(distances)
+        predictions = self.get(key)
+        if predictions is None:
+            predictions = prefix_predictions(distances, model, *args)
+            predictions.flags.writeable = False
+            self.put(key, predictions)
+        return predictions
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'nbytes': self.nbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+
+PREDICTION_CACHE = PredictionCache()
+
+def cached_predictions(distances, model, *args):
+    return PREDICTION_CACHE.predictions(np.asarray(distances, dtype=np.float64), model, *args)
@@ -0,0 +1,200 @@
+'''
+Online versions of the MA, SES, LSM_AR and LSM_SQR time series predictors.
+
+Every predictor is fed one value at a time with update(value) and gives the
+forecast of the next value with predict(), both in constant time, from
+running sums instead of refitting the whole prefix. The sums are accumulated
+in the same order as the list functions in test2.py/test3.py, so a predictor
+fed time_series[0:n] returns exactly what the function returns for it.
+
+Windowed OnlineMA and OnlineLSM_AR add the newest value to the running sums
+and subtract the oldest one, and OnlineLSM_AR solves its 2x2 system in closed
+form, so a forecast costs the same for any window. They agree with the TSP.py
+functions up to rounding; the sums are recomputed once per window to keep
+the drift of the subtractions bounded.
+
+prefix_predictions gives the forecasts after every prefix of every clip at
+once, as the input of the vectorized stoppers in epp.py.
+'''
+from collections import deque
+
+import numpy as np
+
+from lsm_fit import prefix_LSM_exp, prefix_LSM_hprbl
+
+
+class OnlineMA:
+    '''
+    Mean of all values seen, or of the last window values (TSP.py MA)
+    '''
+    def __init__(self, window=None):
+        self.window = window
+        self.values = deque()
+        self.total = 0
+        self.count = 0
+
+    def update(self, value):
+        self.count += 1
+        self.total += value
+        if self.window is not None:
+            self.values.append(value)
+            if len(self.values) > self.window:
+                self.total -= self.values.popleft()
+            if self.count % self.window == 0:
+                self.total = sum(self.values)
+
+    def predict(self):
+        if self.window is None:
+            return self.total / self.count
+        return self.total / len(self.values)
+
+
+class OnlineSES:
+    '''
+    Simple exponential smoothing, predict() is SES(time_series, smoothing_coeficient)[-1]
+    '''
+    def __init__(self, smoothing_coeficient):
+        self.smoothing_coeficient = smoothing_coeficient
+        self.level = None
+        self.last = None
+        self.count = 0
+
+    def update(self, value):
+        self.count += 1
+        if self.level is None:
+            self.level = value
+        else:
+            self.level = self.level + self.smoothing_coeficient * (value - self.level)
+        self.last = value
+
+    def predict(self):
+        return self.level + self.smoothing_coeficient * (self.last - self.level)
+
+
+def solve_LSM_AR(count, sum_x, sum_x2, sum_y, sum_xy):
+    '''
+    Closed form (Cramer's rule) solution of the 2x2 system LSM_AR builds
+    '''
+    det = 4 * count * sum_x2 - 2 * sum_x * sum_x
+    return [(4 * sum_y * sum_x2 - 4 * sum_x * sum_xy) / det, (4 * count * sum_xy - 2 * sum_x * sum_y) / det]
+
+
+class OnlineLSM_AR:
+    '''
+    Linear least squares trend over x = 1..n, predict() is LSM_AR(time_series).
+    With a window the trend is fitted over the last window values, renumbered
+    x = 1..window as TSP.py LSM_AR(time_series, window) does.
+    '''
+    def __init__(self, window=None):
+        self.window = window
+        self.values = deque()
+        self.count = 0
+        self.sum_x = 0
+        self.sum_x2 = 0
+        self.sum_y = 0
+        self.sum_xy = 0
+
+    def update(self, value):
+        self.count += 1
+        if self.window is None:
+            self.sum_x += self.count
+            self.sum_x2 += self.count * self.count
+            self.sum_y += value
+            self.sum_xy += value * self.count
+            return
+        if len(self.values) == self.window:
+            # dropping x = 1 moves every other value one step left
+            self.sum_xy -= self.sum_y
+            self.sum_y -= self.values.popleft()
+        self.values.append(value)
+        size = len(self.values)
+        self.sum_y += value
+        self.sum_xy += value * size
+        self.sum_x = size * (size + 1) // 2
+        self.sum_x2 = size * (size + 1) * (2 * size + 1) // 6
+        if self.count % self.window == 0:
+            # resummed once per window against rounding drift of the subtractions
+            self.sum_y = sum(self.values)
+            self.sum_xy = sum(v * (k + 1) for k, v in enumerate(self.values))
+
+    def coefficients(self):
+        if self.window is not None:
+            return solve_LSM_AR(len(self.values), self.sum_x, self.sum_x2, self.sum_y, self.sum_xy)
+        # the same (unsymmetric) system as LSM_AR builds, second row a_21 is not doubled
+        a = np.array([[2 * self.count, 2 * self.sum_x], [self.sum_x, 2 * self.sum_x2]])
+        b = np.array([2 * self.sum_y, 2 * self.sum_xy])
+        return np.linalg.solve(a, b)
+
+    def predict(self):
+        sltn = self.coefficients()
+        size = self.count if self.window is None else len(self.values)
+        return sltn[0] + sltn[1] * (size + 1)
+
+
+class OnlineLSM_SQR:
+    '''
+    Least squares fit of b * x^2 over x = 1..n, predict() is LSM_SQR(time_series)
+    '''
+    def __init__(self):
+        self.count = 0
+        self.frac_top = 0
+        self.frac_bottom = 0
+
+    def update(self, value):
+        self.count += 1
+        self.frac_top += value * (self.count ** 2)
+        self.frac_bottom += self.count ** 4
+
+    def coefficient(self):
+        '''
+        b, as TSP.py LSM_SQR returns it
+        '''
+        return self.frac_top / self.frac_bottom
+
+    def predict(self):
+        return self.coefficient() * (self.count + 1)
+
+
+def prefix_MA(distances):
+    return np.cumsum(distances, axis=1) / np.arange(1, distances.shape[1] + 1)
+
+def prefix_SES(distances, smoothing_coeficient):
+    predictions = np.empty(distances.shape)
+    level = distances[:, 0].copy()
+    predictions[:, 0] = level + smoothing_coeficient * (distances[:, 0] - level)
+    for n in range(1, distances.shape[1]):
+        level = level + smoothing_coeficient * (distances[:, n] - level)
+        predictions[:, n] = level + smoothing_coeficient * (distances[:, n] - level)
+    return predictions
+
+def prefix_LSM_AR(distances):
+    x = np.arange(1, distances.shape[1] + 1)
+    sum_x = np.cumsum(x)
+    a = np.stack([np.stack([2 * x, 2 * sum_x], axis=-1), \
+                  np.stack([sum_x, 2 * np.cumsum(x * x)], axis=-1)], axis=-2)
+    b = np.stack([2 * np.cumsum(distances, axis=1), 2 * np.cumsum(distances * x, axis=1)], axis=-1)
+    sltn = np.linalg.solve(a, b[..., None])[..., 0]
+    return sltn[..., 0] + sltn[..., 1] * (x + 1)
+
+def prefix_LSM_SQR(distances):
+    x = np.arange(1, distances.shape[1] + 1)
+    return np.cumsum(distances * x ** 2, axis=1) / np.cumsum(x ** 4) * (x + 1)
+
+PREFIX_PREDICTORS = {
+    'MA': prefix_MA,
+    'SES': prefix_SES,
+    'LSM_AR': prefix_LSM_AR,
+    'LSM_SQR': prefix_LSM_SQR,
+    'LSM_exp': prefix_LSM_exp,
+    'LSM_hprbl': prefix_LSM_hprbl
+}
+
+def prefix_predictions(distances, model, *args):
+    '''
+    clips x frames matrix of next value forecasts of model, in one pass over a
+    clips x frames (padded) distance matrix: column n - 1 holds the forecast
+    from the first n distances of the clip, equal to the online predictor fed
+    them. Cumulative sums replace the per-prefix refits, SES runs its
+    recurrence over the frame axis for all clips at once.
+    '''
+    return PREFIX_PREDICTORS[model](np.asarray(distances, dtype=np.float64), *args)
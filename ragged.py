@@ -0,0 +1,161 @@
+'''
+CSR-style storage for clips of different lengths.
+
+values holds the frames of all clips back to back (frames x columns for
+precalc records, flat for distances), clip i is values[offsets[i]:offsets[i + 1]].
+'''
+import numpy as np
+
+
+class RaggedArray:
+    def __init__(self, values, offsets):
+        self.values = values
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_list(cls, records, dtype=np.float64, trailing_shape=None):
+        '''
+        Packs a list of per-clip records (nested lists or arrays)
+        '''
+        arrays = [np.asarray(record, dtype=dtype) for record in records]
+        if trailing_shape is None:
+            trailing_shape = arrays[0].shape[1:] if arrays else ()
+        arrays = [x.reshape((-1,) + tuple(trailing_shape)) for x in arrays]
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(x) for x in arrays])
+        if arrays:
+            values = np.concatenate(arrays)
+        else:
+            values = np.zeros((0,) + tuple(trailing_shape), dtype=dtype)
+        return cls(values, offsets)
+
+    @classmethod
+    def from_spans(cls, values, spans):
+        '''
+        Gathers the clips at [start, length] spans of values into a new RaggedArray
+        '''
+        spans = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+        offsets = np.zeros(len(spans) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(spans[:, 1])
+        gather = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - spans[:, 0], spans[:, 1])
+        return cls(values[gather], offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            return self.values[self.offsets[key]:self.offsets[key + 1]]
+        return self.take(np.arange(len(self))[key] if isinstance(key, slice) else key)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.offsets.nbytes
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    def column(self, c):
+        '''
+        RaggedArray of one column of frames x columns values
+        '''
+        return RaggedArray(self.values[:, c], self.offsets)
+
+    def with_values(self, values):
+        '''
+        RaggedArray with the same clip layout over other per-frame values
+        '''
+        return RaggedArray(values, self.offsets)
+
+    def clip_of_frame(self):
+        '''
+        Clip number of every row of values
+        '''
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def frame_index(self):
+        '''
+        Position of every row of values inside its clip
+        '''
+        return np.arange(self.offsets[-1]) - np.repeat(self.offsets[:-1], self.lengths)
+
+    def take(self, rows):
+        '''
+        New RaggedArray with the clips rows, gathered in one pass. A run of
+        consecutive rows is returned as a view.
+        '''
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) and rows[-1] - rows[0] == len(rows) - 1 and np.all(np.diff(rows) == 1):
+            return RaggedArray(self.values[self.offsets[rows[0]]:self.offsets[rows[-1] + 1]], \
+                               self.offsets[rows[0]:rows[-1] + 2] - self.offsets[rows[0]])
+        return RaggedArray.from_spans(self.values, np.stack([self.offsets[:-1][rows], self.lengths[rows]], axis=1))
+
+    def copy(self):
+        return RaggedArray(np.array(self.values), self.offsets.copy())
+
+    def astype(self, dtype):
+        return RaggedArray(self.values.astype(dtype), self.offsets.copy())
+
+    def last(self):
+        '''
+        Last frame of every clip
+        '''
+        return self.values[self.offsets[1:] - 1]
+
+    def frame_counts(self):
+        '''
+        Number of clips long enough to have every frame position
+        '''
+        return np.bincount(self.frame_index())
+
+    def frame_means(self, frame_values=None):
+        '''
+        Mean over clips at every frame position, averaged over the clips that
+        are long enough to have that frame (frame_counts)
+        '''
+        if frame_values is None:
+            frame_values = self.values
+        return np.bincount(self.frame_index(), weights=frame_values) / self.frame_counts()
+
+    def held_frame_means(self, frame_values=None):
+        '''
+        Mean over all clips at every frame position, a clip shorter than the
+        position taking its last value
+        '''
+        if frame_values is None:
+            frame_values = self.values
+        lengths = self.lengths
+        frames = int(lengths.max()) if len(lengths) else 0
+        sums = np.bincount(self.frame_index(), weights=frame_values, minlength=frames)
+        ended = np.bincount(lengths - 1, weights=frame_values[self.offsets[1:] - 1], minlength=frames)
+        sums[1:] += np.cumsum(ended)[:-1]
+        return sums / len(self)
+
+    def to_padded(self, fill=np.nan, frames=None):
+        '''
+        clips x frames (x columns) array padded with fill, clips longer than
+        frames are cut
+        '''
+        lengths = self.lengths
+        if frames is None:
+            frames = int(lengths.max()) if len(lengths) else 0
+        padded = np.full((len(self), frames) + self.values.shape[1:], fill, dtype=self.values.dtype)
+        frame_index = self.frame_index()
+        kept = frame_index < frames
+        padded[self.clip_of_frame()[kept], frame_index[kept]] = self.values[kept]
+        return padded
+
+    def tolist(self):
+        values = self.values.tolist()
+        return [values[self.offsets[i]:self.offsets[i + 1]] for i in range(len(self))]
@@ -0,0 +1,119 @@
+'''
+Hands loaded clip arrays to worker processes through shared memory.
+
+SharedClipTables copies the registry entries of some (dataset, method) pairs
+once into multiprocessing.shared_memory blocks. Its executor() starts worker
+processes that attach the blocks by name and pin them in their own registry,
+so get_precalc / get_clip_table / iter_clip_blocks in a worker read the
+shared pages instead of loading or unpickling a private copy.
+'''
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dataset_registry import REGISTRY, ALIGNED_KINDS, get_clip_table
+from ragged import RaggedArray
+
+SHARED_KINDS = ['precalc', 'distance', 'clip_index']
+
+# blocks attached by this process, kept open for as long as the arrays are used
+ATTACHED_BLOCKS = []
+
+
+def share_array(array, blocks):
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    blocks.append(block)
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    shared[...] = array
+    shared.flags.writeable = False
+    return shared, {'name': block.name, 'shape': array.shape, 'dtype': array.dtype.str}
+
+def attach_array(handle):
+    # pool workers share the parent's resource tracker, attaching registers
+    # nothing new and the block is unlinked by the parent only
+    block = shared_memory.SharedMemory(name=handle['name'])
+    ATTACHED_BLOCKS.append(block)
+    array = np.ndarray(handle['shape'], dtype=handle['dtype'], buffer=block.buf)
+    array.flags.writeable = False
+    return array
+
+def share_values(values, blocks):
+    '''
+    Shared copy of an array or RaggedArray and its picklable handle
+    '''
+    if isinstance(values, RaggedArray):
+        shared_values, values_handle = share_array(values.values, blocks)
+        shared_offsets, offsets_handle = share_array(values.offsets, blocks)
+        return RaggedArray(shared_values, shared_offsets), {'values': values_handle, 'offsets': offsets_handle}
+    return share_array(values, blocks)
+
+def attach_values(handle):
+    if 'offsets' in handle:
+        return RaggedArray(attach_array(handle['values']), attach_array(handle['offsets']))
+    return attach_array(handle)
+
+def attach(handles):
+    '''
+    Worker initializer: switches the worker's registry to the parent's dtype
+    and pins every shared entry in it
+    '''
+    REGISTRY.dtype = handles['dtype']
+    for key, handle in handles['entries'].items():
+        REGISTRY.pin(key, attach_values(handle))
+
+
+class SharedClipTables:
+    '''
+    with SharedClipTables([(dataset, method), ...]) as tables:
+        with tables.executor(16) as pool:
+            results = list(pool.map(collector, ...))
+
+    The parent serves the shared copies from its registry too, so the data is
+    held once however many workers run. Blocks are unlinked on exit.
+    '''
+    def __init__(self, pairs, kinds=SHARED_KINDS):
+        self.pairs = pairs
+        self.kinds = kinds
+        self.blocks = []
+        self.handles = {'dtype': REGISTRY.dtype, 'entries': {}}
+
+    def share(self, key, values):
+        shared, self.handles['entries'][key] = share_values(values, self.blocks)
+        REGISTRY.pin(key, shared)
+
+    def __enter__(self):
+        # the dtype travels with the handles, a spawned worker does not
+        # inherit the parent's registry settings
+        dtype = self.handles['dtype'] = REGISTRY.dtype
+        for dataset, method in self.pairs:
+            for kind in self.kinds:
+                self.share((dataset, method, kind, dtype), REGISTRY.get(dataset, method, kind))
+            if 'clip_index' in self.kinds:
+                # clip tables gathered out of order are shared too
+                get_clip_table(dataset, method)
+                for kind in ALIGNED_KINDS.values():
+                    key = (dataset, method, kind, dtype)
+                    if key in REGISTRY.entries:
+                        self.share(key, REGISTRY.entries[key])
+        return self
+
+    def executor(self, workers=None):
+        return ProcessPoolExecutor(workers, initializer=attach, initargs=(self.handles,))
+
+    @property
+    def nbytes(self):
+        return sum(block.size for block in self.blocks)
+
+    def __exit__(self, *exc):
+        for key in self.handles['entries']:
+            REGISTRY.pinned.pop(key, None)
+        for block in self.blocks:
+            block.unlink()
+            try:
+                block.close()
+            except BufferError:
+                # arrays still referenced by the caller keep the mapping alive
+                pass
+        self.blocks = []
+        self.handles = {'dtype': REGISTRY.dtype, 'entries': {}}
@@ -0,0 +1,106 @@
+import os, json, shutil
+
+import numpy as np
+import pytest
+
+import precalc_store
+from clip_archive import export_archive
+from dataset_registry import REGISTRY, DatasetRegistry, get_archive, get_clip_table, iter_clip_blocks
+from precalc_store import precalc_directory
+from shared_clips import SharedClipTables
+
+DATASET = 'test'
+METHOD = 'base'
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    '''
+    precalc and distance directories of 30 ragged clips in the working
+    directory, the distance side missing one clip and holding an extra one
+    '''
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    for kind, ids in [('precalc', range(30)), ('distance', list(range(1, 30)) + [40])]:
+        precalc_dir = precalc_directory(DATASET, METHOD, kind)
+        os.makedirs(precalc_dir)
+        for i in ids:
+            length = 1 + (i * 7) % 11
+            record = rng.uniform(0, 1, (length, 4)) if kind == 'precalc' else rng.uniform(0, 3, length)
+            with open(os.path.join(precalc_dir, 'clip%02d.json' % i), 'w') as js:
+                json.dump(record.tolist(), js)
+    REGISTRY.clear()
+    yield
+    REGISTRY.clear()
+
+def test_clear_resets_stats():
+    registry = DatasetRegistry(memory_limit=64)
+    for i in range(4):
+        registry.get_built(('d', 'm', 'k', i), lambda: np.zeros(4))
+    registry.get_built(('d', 'm', 'k', 3), lambda: np.zeros(4))
+    assert registry.stats()['evictions'] > 0
+    registry.clear()
+    assert registry.stats() == {'entries': 0, 'pinned': 0, 'opened': 0, 'nbytes': 0, 'hits': 0, 'misses': 0, 'evictions': 0}
+
+def check_blocks(blocks):
+    precalc, precalc_dist = get_clip_table(DATASET, METHOD)
+    assert [len(block[0]) for block in blocks] == [8, 8, 8, 5]
+    for table, part in [(precalc, 0), (precalc_dist, 1)]:
+        clips = [clip for block in blocks for clip in block[part]]
+        assert len(clips) == len(table)
+        for clip, expected in zip(clips, table):
+            assert np.array_equal(clip, expected)
+
+@pytest.mark.usefixtures('dataset')
+@pytest.mark.filterwarnings('ignore:precalc_base_test')
+def test_iter_clip_blocks_opens_once(monkeypatch):
+    check_blocks(list(iter_clip_blocks(DATASET, METHOD, 8)))
+    updates = []
+    update_cache = precalc_store.update_cache
+    monkeypatch.setattr(precalc_store, 'update_cache', lambda *args: updates.append(args) or update_cache(*args))
+    for i in range(3):
+        check_blocks(list(iter_clip_blocks(DATASET, METHOD, 8)))
+    assert updates == []
+
+def worker_blocks(block_clips):
+    '''
+    Blocks of a collector in a worker, with what they were read from
+    '''
+    blocks = list(iter_clip_blocks(DATASET, METHOD, block_clips))
+    shared = REGISTRY.pinned[(DATASET, METHOD, 'aligned_precalc', REGISTRY.dtype)]
+    return [block[0].tolist() for block in blocks], [block[1].tolist() for block in blocks], \
+           np.shares_memory(blocks[0][0].values, shared.values), sorted([key[2] for key in REGISTRY.opened])
+
+@pytest.mark.usefixtures('dataset')
+@pytest.mark.filterwarnings('ignore:precalc_base_test')
+def test_worker_blocks_read_shared_tables():
+    precalc, precalc_dist = [table.tolist() for table in get_clip_table(DATASET, METHOD)]
+    with SharedClipTables([(DATASET, METHOD)]) as tables:
+        # the workers may only read the shared copies
+        shutil.rmtree(precalc_store.PRECALC_CACHE_DIRECTORY)
+        for kind in ['precalc', 'distance']:
+            shutil.rmtree(precalc_directory(DATASET, METHOD, kind))
+        with tables.executor(2) as pool:
+            results = list(pool.map(worker_blocks, [8, 8]))
+    for precalc_blocks, precalc_dist_blocks, shared, opened in results:
+        assert [clip for block in precalc_blocks for clip in block] == precalc
+        assert [clip for block in precalc_dist_blocks for clip in block] == precalc_dist
+        assert shared
+        assert 'precalc' not in opened and 'distance' not in opened
+
+@pytest.mark.usefixtures('dataset')
+@pytest.mark.filterwarnings('ignore:precalc_base_test')
+def test_stale_archive_falls_back_to_directories():
+    export_archive(DATASET, METHOD)
+    assert get_archive(DATASET, METHOD) is not None
+    precalc = get_clip_table(DATASET, METHOD)[0].tolist()
+
+    REGISTRY.clear()
+    with open(os.path.join(precalc_directory(DATASET, METHOD, 'distance'), 'clip05.json'), 'w') as js:
+        json.dump([2.0, 1.0, 0.5], js)
+    with pytest.warns(UserWarning, match='changed since the archive was exported'):
+        assert get_archive(DATASET, METHOD) is None
+    precalc_table, precalc_dist = get_clip_table(DATASET, METHOD)
+    assert precalc_table.tolist() == precalc
+    assert precalc_dist[4].tolist() == [2.0, 1.0, 0.5]
+    assert [block[1][4].tolist() for block in iter_clip_blocks(DATASET, METHOD, 8)][0] == [2.0, 1.0, 0.5]
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from epp import chunked_greedy_roc, chunked_oracle_frontier, chunked_stopper_epp, chunked_threshold_epp, \
+                fixed_scores, frontier_gap, lagged_scores, modelling_scores, ses_scores, EXACT_THRESHOLDS
+from predictors import OnlineMA, OnlineSES, OnlineLSM_AR
+from ragged import RaggedArray
+
+SMOOTHING_COEFICIENT = 0.9
+MODELS = {
+    'MA': OnlineMA,
+    'LSM_AR': OnlineLSM_AR
+}
+
+
+def make_blocks(clips=24, block_clips=5, seed=0):
+    '''
+    (precalc, precalc_dist) blocks of random clips, distances up to 3 so
+    that thresholds above 1.0 stop clips too
+    '''
+    rng = np.random.default_rng(seed)
+    precalc = []
+    precalc_dist = []
+    for i in range(clips):
+        length = int(rng.integers(1, 12))
+        precalc.append(np.column_stack([rng.uniform(0, 1, length), rng.uniform(0, 1, length)]))
+        precalc_dist.append(rng.uniform(0, 3, length))
+    return [(RaggedArray.from_list(precalc[k:k + block_clips]), RaggedArray.from_list(precalc_dist[k:k + block_clips])) \
+            for k in range(0, clips, block_clips)]
+
+def forecast(predictor, values):
+    for value in values:
+        predictor.update(value)
+    return predictor.predict()
+
+def loop_epp(blocks, delta, thresholds):
+    '''
+    The per-threshold loop of the *_stopper_epp collectors, delta(distances,
+    clip_start, i) is the score of frame i
+    '''
+    precalc = [clip for block in blocks for clip in block[0]]
+    precalc_dist = [clip for block in blocks for clip in block[1]]
+    x = []
+    y = []
+    for threshold in thresholds:
+        sum_clip_length = 0.0
+        sum_error_level = 0.0
+        for precalc_data, distances in zip(precalc, precalc_dist):
+            stopped = False
+            clip_start = 1 if threshold <= 1.0 else 0
+            for i in range(clip_start, len(precalc_data)):
+                if delta(distances, clip_start, i) <= threshold:
+                    sum_clip_length += i + 1
+                    sum_error_level += precalc_data[i][0]
+                    stopped = True
+                    break
+            if not stopped:
+                sum_clip_length += len(precalc_data)
+                sum_error_level += precalc_data[-1][0]
+        x.append(sum_clip_length / len(precalc))
+        y.append(sum_error_level / len(precalc))
+    return x, y
+
+def model_delta(model):
+    def delta(distances, clip_start, i):
+        return forecast(MODELS[model](), distances[clip_start:i] if i > clip_start else [distances[i]])
+    return delta
+
+def ses_delta(distances, clip_start, i):
+    return forecast(OnlineSES(SMOOTHING_COEFICIENT), distances[0:i] if i > clip_start else [distances[i]])
+
+def check_epp(blocks, delta, epp):
+    rng = np.random.default_rng(1)
+    thresholds = np.concatenate([rng.uniform(-0.1, 3.5, 200), [0.5, 1.0, 1.5, 50.0]])
+    x, y = loop_epp(blocks, delta, thresholds)
+
+    grid = epp(thresholds)
+    assert grid[0] == x
+    assert np.allclose(grid[1], y)
+
+    # every point the loop reaches is a step of the exact curve
+    exact = list(zip(*epp(EXACT_THRESHOLDS)))
+    for point in zip(x, y):
+        assert any(point[0] == x_exact and np.isclose(point[1], y_exact) for x_exact, y_exact in exact)
+
+
+@pytest.mark.parametrize('model', sorted(MODELS))
+def test_stopper_epp_matches_loop_above_one(model):
+    blocks = make_blocks()
+    check_epp(blocks, model_delta(model), \
+              lambda thresholds: chunked_stopper_epp(iter(blocks), model, thresholds=thresholds))
+
+def test_ses_stopper_epp_matches_loop_above_one():
+    blocks = make_blocks()
+    check_epp(blocks, ses_delta, \
+              lambda thresholds: chunked_threshold_epp(iter(blocks), \
+                                                       lambda precalc, precalc_dist: ses_scores(precalc_dist, SMOOTHING_COEFICIENT), \
+                                                       thresholds, \
+                                                       lambda precalc, precalc_dist: lagged_scores(precalc_dist, 'SES', SMOOTHING_COEFICIENT)))
+
+@pytest.mark.parametrize('score', [
+    lambda precalc, precalc_dist: precalc_dist,
+    lambda precalc, precalc_dist: fixed_scores(precalc_dist),
+    lambda precalc, precalc_dist: lagged_scores(precalc_dist, 'SES', SMOOTHING_COEFICIENT),
+    lambda precalc, precalc_dist: modelling_scores(precalc),
+    lambda precalc, precalc_dist: precalc_dist.with_values(-precalc.values[:, 0])
+])
+def test_oracle_frontier_below_greedy_roc(score):
+    blocks = make_blocks(clips=60, block_clips=7, seed=2)
+    oracle = chunked_oracle_frontier(iter(blocks))
+    for clip_start, last in [(0, False), (1, True)]:
+        curve = chunked_greedy_roc(iter(blocks), score, clip_start, last)
+        assert min(frontier_gap(curve, oracle)) >= -1e-12
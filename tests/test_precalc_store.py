@@ -0,0 +1,136 @@
+import os, json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+import precalc_store
+from precalc_store import COMPACT_FRACTION, VALUES_FILE, build_cache, cache_directory, update_cache, load_directory, read_index
+
+
+@pytest.fixture
+def precalc_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(precalc_store, 'PRECALC_CACHE_DIRECTORY', str(tmp_path / 'precalc_cache'))
+    path = tmp_path / 'precalc_base_test'
+    path.mkdir()
+    return str(path)
+
+def write_clip(precalc_dir, name, record):
+    path = os.path.join(precalc_dir, name + '.json')
+    with open(path, 'w') as js:
+        json.dump(record, js)
+    # a rewrite within the mtime resolution would look unchanged
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+def clip_record(seed, length):
+    return np.random.default_rng(seed).uniform(0, 1, (length, 4)).tolist()
+
+def test_build_cache_parallel(precalc_dir):
+    for i in range(40):
+        write_clip(precalc_dir, 'clip%02d' % i, clip_record(i, 1 + i % 7))
+    build_cache(precalc_dir, workers=3, executor='thread')
+    clips = load_directory(precalc_dir)
+    for precalc_file, clip in zip(read_index(precalc_dir)['files'], clips):
+        with open(os.path.join(precalc_dir, precalc_file)) as js:
+            assert np.array_equal(clip, json.load(js))
+
+@pytest.mark.parametrize('record', [[], [[]]], ids=['no_frames', 'empty_frame'])
+def test_empty_record_rejected(precalc_dir, record):
+    write_clip(precalc_dir, 'clip00', clip_record(0, 3))
+    write_clip(precalc_dir, 'clip01', record)
+    with pytest.raises(ValueError, match='clip01.json'):
+        build_cache(precalc_dir, workers=1)
+
+def test_empty_record_rejected_on_update(precalc_dir):
+    write_clip(precalc_dir, 'clip00', clip_record(0, 3))
+    build_cache(precalc_dir, workers=1)
+    write_clip(precalc_dir, 'clip01', [])
+    with pytest.raises(ValueError, match='clip01.json has no frames'):
+        update_cache(precalc_dir, workers=1)
+
+def cached_clips(precalc_dir):
+    index = read_index(precalc_dir)
+    return dict(zip(index['files'], [np.array(x) for x in load_directory(precalc_dir)])), index['manifest']
+
+def check_against_build(precalc_dir, tmp_path, monkeypatch):
+    '''
+    The updated cache holds the same clips and manifest as a cache built from scratch
+    '''
+    updated, updated_manifest = cached_clips(precalc_dir)
+    monkeypatch.setattr(precalc_store, 'PRECALC_CACHE_DIRECTORY', str(tmp_path / 'fresh_cache'))
+    build_cache(precalc_dir, workers=1)
+    built, built_manifest = cached_clips(precalc_dir)
+    assert sorted(updated) == sorted(built)
+    for precalc_file in built:
+        assert np.array_equal(updated[precalc_file], built[precalc_file])
+    assert updated_manifest == built_manifest
+
+@pytest.fixture
+def cached_dir(precalc_dir):
+    for i in range(8):
+        write_clip(precalc_dir, 'clip%02d' % i, clip_record(i, 10))
+    build_cache(precalc_dir, workers=1)
+    return precalc_dir
+
+def stored_frames(precalc_dir):
+    return len(np.load(os.path.join(cache_directory(precalc_dir), VALUES_FILE), mmap_mode='r'))
+
+@pytest.mark.parametrize('length', [10, 14, 6], ids=['same_length', 'longer', 'shorter'])
+def test_update_changed_clip(cached_dir, tmp_path, monkeypatch, length):
+    write_clip(cached_dir, 'clip03', clip_record(100, length))
+    assert update_cache(cached_dir, workers=2, executor='thread') == 1
+    assert stored_frames(cached_dir) == 80 + (length if length != 10 else 0)
+    check_against_build(cached_dir, tmp_path, monkeypatch)
+
+def test_update_added_clip(cached_dir, tmp_path, monkeypatch):
+    write_clip(cached_dir, 'clip08', clip_record(8, 5))
+    write_clip(cached_dir, 'clip_new', clip_record(9, 3))
+    assert update_cache(cached_dir, workers=1) == 2
+    check_against_build(cached_dir, tmp_path, monkeypatch)
+
+def test_update_deleted_clip(cached_dir, tmp_path, monkeypatch):
+    os.remove(os.path.join(cached_dir, 'clip05.json'))
+    assert update_cache(cached_dir, workers=1) == 0
+    check_against_build(cached_dir, tmp_path, monkeypatch)
+
+def test_update_touched_clip(cached_dir, tmp_path, monkeypatch):
+    path = os.path.join(cached_dir, 'clip02.json')
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 5 * 10 ** 9))
+    spans = read_index(cached_dir)['spans']
+    assert update_cache(cached_dir, workers=1) == 0
+    assert read_index(cached_dir)['manifest']['clip02.json']['mtime'] == os.stat(path).st_mtime
+    assert read_index(cached_dir)['spans'] == spans
+    check_against_build(cached_dir, tmp_path, monkeypatch)
+
+def test_update_compacts(cached_dir, tmp_path, monkeypatch):
+    # 10 dead frames of 80 stay below COMPACT_FRACTION
+    os.remove(os.path.join(cached_dir, 'clip00.json'))
+    update_cache(cached_dir, workers=1)
+    assert stored_frames(cached_dir) == 80
+    # 30 dead frames of 80 do not
+    assert 30 > COMPACT_FRACTION * 80
+    for i in [1, 2]:
+        os.remove(os.path.join(cached_dir, 'clip%02d.json' % i))
+    update_cache(cached_dir, workers=1)
+    assert stored_frames(cached_dir) == 50
+    starts = [start for start, length in read_index(cached_dir)['spans']]
+    assert starts == list(range(0, 50, 10))
+    check_against_build(cached_dir, tmp_path, monkeypatch)
+
+def open_float32(precalc_dir):
+    values, spans = precalc_store.open_directory(precalc_dir, dtype='float32')
+    return np.array(values), spans
+
+def test_concurrent_update_and_derive(cached_dir):
+    write_clip(cached_dir, 'clip03', clip_record(100, 14))
+    write_clip(cached_dir, 'clip08', clip_record(8, 5))
+    with ProcessPoolExecutor(4) as pool:
+        results = list(pool.map(open_float32, [cached_dir] * 8))
+    clips, manifest = cached_clips(cached_dir)
+    assert len(clips) == 9
+    for values, spans in results:
+        assert len(values) == 80 + 14 + 5
+        assert np.array_equal(values, np.load(precalc_store.storage_path(cached_dir), mmap_mode='r').astype(np.float32))
+    assert [x for x in os.listdir(cache_directory(cached_dir)) if x.endswith('.tmp')] == []
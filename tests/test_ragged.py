@@ -0,0 +1,24 @@
+import numpy as np
+
+from ragged import RaggedArray
+
+
+def make_clips(seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.uniform(0, 1, int(rng.integers(1, 9))) for i in range(25)]
+
+def test_frame_means_and_counts():
+    clips = make_clips()
+    ragged = RaggedArray.from_list(clips)
+    frames = max([len(x) for x in clips])
+    counts = [sum([len(x) > i for x in clips]) for i in range(frames)]
+    means = [np.mean([x[i] for x in clips if len(x) > i]) for i in range(frames)]
+    assert ragged.frame_counts().tolist() == counts
+    assert np.allclose(ragged.frame_means(), means)
+
+def test_held_frame_means():
+    clips = make_clips(1)
+    ragged = RaggedArray.from_list(clips)
+    frames = max([len(x) for x in clips])
+    held = [np.mean([x[min(i, len(x) - 1)] for x in clips]) for i in range(frames)]
+    assert np.allclose(ragged.held_frame_means(), held)